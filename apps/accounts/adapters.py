@@ -58,7 +58,7 @@ class CustomSignupForm(SignupForm):
         if not re.match(r'^[a-zA-Z0-9_]+$', username):
             raise forms.ValidationError('Username can only contain letters, numbers, and underscores.')
 
-        if Profile.objects.filter(username=username).exists():
+        if Profile.objects.filter(username__iexact=username).exists():
             raise forms.ValidationError('This username is already taken.')
 
         return username
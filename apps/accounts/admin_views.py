@@ -258,6 +258,17 @@ def edit_user(request, user_id):
         profile.country_code = request.POST.get('country_code', '').strip().upper()
         profile.timezone = request.POST.get('timezone', '').strip()
 
+        # Usernames are unique regardless of case
+        if profile.username and Profile.objects.filter(
+            username__iexact=profile.username
+        ).exclude(pk=profile.pk).exists():
+            messages.error(request, f'The username "{profile.username}" is already taken.')
+            return render(request, 'admin/user_edit.html', {
+                'user_obj': user,
+                'title': f'Edit User: {user.email}',
+                'active_page': 'users',
+            })
+
         try:
             user.save()
             profile.save()
@@ -302,6 +313,14 @@ def create_user(request):
                 'active_page': 'users',
             })
 
+        # Usernames are unique regardless of case
+        if username and Profile.objects.filter(username__iexact=username).exists():
+            messages.error(request, f'The username "{username}" is already taken.')
+            return render(request, 'admin/user_create.html', {
+                'title': 'Create User',
+                'active_page': 'users',
+            })
+
         try:
             # Create user with email as username (Django requires username)
             user = User.objects.create(
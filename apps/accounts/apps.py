@@ -8,3 +8,19 @@ class AccountsConfig(AppConfig):
 
     def ready(self):
         import apps.accounts.signals  # noqa
+        self.configure_stripe()
+
+    @staticmethod
+    def configure_stripe():
+        """
+        Configure the Stripe client once per process.
+
+        A single module-level HTTP client keeps its connection pool (and TLS
+        sessions) alive across Stripe calls instead of views re-configuring
+        the library on every request.
+        """
+        import stripe
+        from django.conf import settings
+
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+        stripe.default_http_client = stripe.RequestsClient(verify_ssl_certs=True)
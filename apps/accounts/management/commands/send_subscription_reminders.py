@@ -11,7 +11,6 @@ This command sends:
 import stripe
 from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
-from django.conf import settings
 from django.utils import timezone
 from apps.accounts.models import Profile
 from apps.accounts.subscription_emails import (
@@ -39,8 +38,6 @@ class Command(BaseCommand):
         if dry_run:
             self.stdout.write(self.style.WARNING('DRY RUN - No emails will be sent'))
 
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
         # Get all premium users with active subscriptions
         premium_profiles = Profile.objects.filter(
             subscription_tier='premium',
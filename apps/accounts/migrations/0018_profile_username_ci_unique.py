@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-16 10:00
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import Lower
+
+
+def clear_duplicate_usernames(apps, schema_editor):
+    # Usernames that differ only by case can't coexist under the constraint
+    # below; the earliest profile keeps the name, the others pick a new one
+    Profile = apps.get_model("accounts", "Profile")
+    named = Profile.objects.exclude(username__isnull=True).annotate(username_lower=Lower("username"))
+    duplicates = (
+        named.values("username_lower")
+        .annotate(first_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for dup in duplicates:
+        named.filter(
+            username_lower=dup["username_lower"],
+        ).exclude(id=dup["first_id"]).update(username=None)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0017_add_tutorial_completed"),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_duplicate_usernames, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="profile",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("username"),
+                name="profile_username_ci_unique",
+            ),
+        ),
+    ]
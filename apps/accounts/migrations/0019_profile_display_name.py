@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-16 10:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Q, Subquery, Value
+from django.db.models.functions import Concat
+
+
+def backfill_display_name(apps, schema_editor):
+    """Populate display_name for existing profiles in two bulk UPDATEs."""
+    Profile = apps.get_model('accounts', 'Profile')
+    User = apps.get_model('auth', 'User')
+
+    no_username = Q(username__isnull=True) | Q(username='')
+    Profile.objects.exclude(no_username).update(
+        display_name=Concat(Value('@'), 'username')
+    )
+    Profile.objects.filter(no_username).update(
+        display_name=Subquery(
+            User.objects.filter(id=OuterRef('user_id')).values('email')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0018_profile_username_ci_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="display_name",
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                help_text="Name shown to other users (@username, or email if no username)",
+                max_length=254,
+            ),
+        ),
+        migrations.RunPython(backfill_display_name, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-16 12:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_completed_payments(apps, schema_editor):
+    # Stripe retries recorded some successful invoices more than once; keep the
+    # first row per payment intent and period so the constraint below can be added
+    Payment = apps.get_model("accounts", "Payment")
+    completed = Payment.objects.filter(status="completed").exclude(stripe_payment_intent_id="")
+    duplicates = (
+        completed.values("stripe_payment_intent_id", "period_start")
+        .annotate(first_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for dup in duplicates:
+        completed.filter(
+            stripe_payment_intent_id=dup["stripe_payment_intent_id"],
+            period_start=dup["period_start"],
+        ).exclude(id=dup["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0019_profile_display_name"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_completed_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="payment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "completed"), models.Q(("stripe_payment_intent_id", ""), _negated=True)),
+                fields=("stripe_payment_intent_id", "period_start"),
+                name="payment_unique_completed_intent_period",
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-16 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0020_payment_unique_completed_intent_period"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="familymember",
+            index=models.Index(
+                fields=["admin", "status", "member"], name="accounts_fa_adm_sta_mem_idx"
+            ),
+        ),
+    ]
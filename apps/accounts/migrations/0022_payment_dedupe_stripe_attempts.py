@@ -0,0 +1,61 @@
+# Generated by Django 5.2.9 on 2026-10-16 14:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_completed_payments(apps, schema_editor):
+    # Stripe retries recorded some successful invoices more than once; keep the
+    # first row per payment intent so the unique constraint below can be added
+    Payment = apps.get_model("accounts", "Payment")
+    completed = Payment.objects.filter(status="completed").exclude(stripe_payment_intent_id="")
+    duplicates = (
+        completed.values("stripe_payment_intent_id")
+        .annotate(first_id=Min("id"), rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for dup in duplicates:
+        completed.filter(
+            stripe_payment_intent_id=dup["stripe_payment_intent_id"],
+        ).exclude(id=dup["first_id"]).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("accounts", "0021_familymember_admin_status_member_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="payment",
+            name="stripe_invoice_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="attempt_count",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RemoveConstraint(
+            model_name="payment",
+            name="payment_unique_completed_intent_period",
+        ),
+        migrations.RunPython(remove_duplicate_completed_payments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="payment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "completed"), models.Q(("stripe_payment_intent_id", ""), _negated=True)),
+                fields=("stripe_payment_intent_id",),
+                name="payment_unique_completed_intent",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="payment",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "failed"), models.Q(("stripe_invoice_id", ""), _negated=True)),
+                fields=("stripe_invoice_id", "attempt_count"),
+                name="payment_unique_failed_invoice_attempt",
+            ),
+        ),
+    ]
@@ -2,6 +2,7 @@ import secrets
 from datetime import timedelta
 
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -39,6 +40,14 @@ class Profile(models.Model):
         help_text="Your unique @username for friends to find you"
     )
 
+    # Denormalized @username or email, kept in sync by save()
+    display_name = models.CharField(
+        max_length=254,
+        blank=True,
+        editable=False,
+        help_text="Name shown to other users (@username, or email if no username)"
+    )
+
     # Subscription
     subscription_tier = models.CharField(
         max_length=20,
@@ -170,11 +179,27 @@ class Profile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                Lower('username'),
+                name='profile_username_ci_unique'
+            ),
+        ]
+
     def __str__(self):
         return f"Profile for {self.user.email}"
 
-    @property
-    def display_name(self):
+    def save(self, *args, **kwargs):
+        # Keep display_name in sync whenever username may have changed
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'username' in update_fields:
+            self.display_name = self.build_display_name()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'display_name'}
+        super().save(*args, **kwargs)
+
+    def build_display_name(self):
         """Return username or email for display."""
         return f"@{self.username}" if self.username else self.user.email
 
@@ -285,6 +310,24 @@ class Friendship(models.Model):
             friends.append(f.user2 if f.user1 == user else f.user1)
         return friends
 
+    @classmethod
+    def get_friends_with_usernames(cls, user):
+        """
+        Get friends who have a username, ordered by username.
+
+        Single query returning Users with their profile joined and only the
+        columns needed for @mention autocomplete loaded.
+        """
+        from django.db.models import Q
+        return User.objects.filter(
+            Q(id__in=cls.objects.filter(user2=user).values('user1'))
+            | Q(id__in=cls.objects.filter(user1=user).values('user2'))
+        ).exclude(
+            Q(profile__username__isnull=True) | Q(profile__username='')
+        ).select_related('profile').only(
+            'id', 'email', 'profile__username', 'profile__display_name'
+        ).order_by(Lower('profile__username'))
+
 
 class FriendRequest(models.Model):
     """
@@ -475,6 +518,7 @@ class FamilyMember(models.Model):
         indexes = [
             models.Index(fields=['admin', 'status']),
             models.Index(fields=['member', 'status']),
+            models.Index(fields=['admin', 'status', 'member'], name='accounts_fa_adm_sta_mem_idx'),
         ]
 
     def __str__(self):
@@ -552,6 +596,10 @@ class Payment(models.Model):
     # Stripe-specific fields
     stripe_payment_intent_id = models.CharField(max_length=255, blank=True)
     stripe_customer_id = models.CharField(max_length=255, blank=True)
+    # Invoice and its attempt number; failed retries share an intent, so these
+    # tell one failed attempt from a redelivery of the same webhook
+    stripe_invoice_id = models.CharField(max_length=255, blank=True)
+    attempt_count = models.PositiveIntegerField(null=True, blank=True)
 
     # Period covered by this payment
     period_start = models.DateField(null=True, blank=True)
@@ -572,6 +620,21 @@ class Payment(models.Model):
             models.Index(fields=['status', '-created_at']),
             models.Index(fields=['stripe_payment_intent_id']),
         ]
+        constraints = [
+            # One completed row per Stripe payment intent, so replayed invoice
+            # webhooks can't double-insert ($0 trial invoices have no intent)
+            models.UniqueConstraint(
+                fields=['stripe_payment_intent_id'],
+                condition=models.Q(status='completed') & ~models.Q(stripe_payment_intent_id=''),
+                name='payment_unique_completed_intent',
+            ),
+            # Failed retries legitimately share an intent; one row per invoice attempt
+            models.UniqueConstraint(
+                fields=['stripe_invoice_id', 'attempt_count'],
+                condition=models.Q(status='failed') & ~models.Q(stripe_invoice_id=''),
+                name='payment_unique_failed_invoice_attempt',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - ${self.amount} ({self.status})"
@@ -12,6 +12,12 @@ from .friends import (
     get_friendship_status,
     FriendshipError,
 )
+from .stripe_webhooks import (
+    dispatch_stripe_event,
+    forget_customer_profile,
+    stripe_event_cache_key,
+    subscription_cache_key,
+)
 
 __all__ = [
     'send_friend_request',
@@ -26,4 +32,8 @@ __all__ = [
     'search_users_by_username',
     'get_friendship_status',
     'FriendshipError',
+    'dispatch_stripe_event',
+    'forget_customer_profile',
+    'stripe_event_cache_key',
+    'subscription_cache_key',
 ]
@@ -5,6 +5,7 @@ Business logic for friend operations, separated from views.
 """
 import logging
 from django.db import transaction
+from django.db.models import Case, CharField, Q, Value, When
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -307,15 +308,29 @@ def deny_invitation(user, invitation_id):
 
 
 def get_pending_friend_requests(user):
-    """Get all pending friend requests for a user."""
-    return {
-        'received': FriendRequest.objects.filter(
-            recipient=user, status='pending'
-        ).select_related('sender', 'sender__profile').order_by('-created_at'),
-        'sent': FriendRequest.objects.filter(
-            sender=user, status='pending'
-        ).select_related('recipient', 'recipient__profile').order_by('-created_at'),
-    }
+    """
+    Get all pending friend requests for a user.
+
+    Fetches both directions in one query, annotated with 'sent'/'received',
+    and buckets them in Python (newest first).
+    """
+    pending = FriendRequest.objects.filter(
+        Q(sender=user) | Q(recipient=user),
+        status='pending'
+    ).select_related(
+        'sender', 'sender__profile', 'recipient', 'recipient__profile'
+    ).annotate(
+        direction=Case(
+            When(sender=user, then=Value('sent')),
+            default=Value('received'),
+            output_field=CharField(),
+        )
+    ).order_by('-created_at')
+
+    buckets = {'received': [], 'sent': []}
+    for friend_request in pending:
+        buckets[friend_request.direction].append(friend_request)
+    return buckets
 
 
 def get_pending_invitations(user):
@@ -335,16 +350,15 @@ def search_users_by_username(query, exclude_user=None, limit=10):
     Search for users by username prefix.
 
     Used for autocomplete in friend request form.
+    Returns dicts with user_id, username, display_name and user__email.
     """
     query = query.strip().lstrip('@').lower()
     if len(query) < 2:
         return []
 
-    profiles = Profile.objects.filter(
-        username__icontains=query
-    ).select_related('user')[:limit]
+    profiles = Profile.objects.filter(username__icontains=query)
 
     if exclude_user:
         profiles = profiles.exclude(user=exclude_user)
 
-    return profiles
+    return profiles.values('user_id', 'username', 'display_name', 'user__email')[:limit]
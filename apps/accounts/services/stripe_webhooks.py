@@ -0,0 +1,271 @@
+"""
+Stripe webhook event handling.
+
+Handlers run from the process_stripe_event Celery task (or inline when the
+broker is down), after stripe_webhook has verified and de-duplicated the event.
+"""
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone as django_timezone
+
+from ..models import Payment, Profile, SubscriptionHistory
+
+STRIPE_CUSTOMER_PROFILE_CACHE_TIMEOUT = 3600
+
+
+def dispatch_stripe_event(event_type, data_object):
+    """
+    Route a verified Stripe event to its handler.
+
+    All writes for one event share a single transaction.
+    """
+    handler = _HANDLERS.get(event_type)
+    if handler is None:
+        return
+
+    with transaction.atomic():
+        handler(data_object)
+
+
+def _customer_profile_key(customer_id):
+    return f"prof:cust:{customer_id}"
+
+
+def forget_customer_profile(customer_id):
+    """Drop the cached profile ids for a customer (call when the id is assigned)."""
+    cache.delete(_customer_profile_key(customer_id))
+
+
+def stripe_event_cache_key(event_id):
+    """Dedup key claimed by stripe_webhook for the first delivery of an event."""
+    return f"stripe_evt:{event_id}"
+
+
+def subscription_cache_key(subscription_id):
+    """Cache key for the manage_subscription snapshot of a Stripe subscription."""
+    return f"stripe_sub:{subscription_id}"
+
+
+def _profile_ids_for_customer(customer_id):
+    """
+    Return (profile_pk, user_id) for a Stripe customer, or None if unknown.
+
+    Cached so bursts of invoice webhooks for the same customer don't each
+    look the profile up again.
+    """
+    cache_key = _customer_profile_key(customer_id)
+    ids = cache.get(cache_key)
+    if ids is None:
+        ids = Profile.objects.filter(
+            stripe_customer_id=customer_id
+        ).values_list('pk', 'user_id').first()
+        if ids:
+            cache.set(cache_key, ids, STRIPE_CUSTOMER_PROFILE_CACHE_TIMEOUT)
+    return ids
+
+
+def _user_for_customer(customer_id, user_id):
+    """
+    Load the user (with profile) behind a cached customer lookup.
+
+    Returns None, and forgets the cached ids, if the user or profile has been
+    deleted since they were cached.
+    """
+    try:
+        user = User.objects.select_related('profile').get(pk=user_id)
+        user.profile  # raises if the profile row is gone
+    except (User.DoesNotExist, Profile.DoesNotExist):
+        forget_customer_profile(customer_id)
+        return None
+    return user
+
+
+def _violated_constraint(error):
+    """Name of the constraint behind an IntegrityError, if the driver reports one."""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None)
+
+
+def _handle_subscription_updated(subscription):
+    """Handle subscription update webhook."""
+    customer_id = subscription['customer']
+    cache.delete(subscription_cache_key(subscription['id']))
+    try:
+        profile = Profile.objects.only(
+            'id', 'user_id', 'subscription_status', 'subscription_tier'
+        ).get(stripe_customer_id=customer_id)
+        old_status = profile.subscription_status
+
+        fields = {
+            'subscription_status': subscription['status'],
+            'stripe_subscription_id': subscription['id'],
+            'updated_at': django_timezone.now(),
+        }
+
+        # Update tier based on status
+        if subscription['status'] == 'active':
+            fields['subscription_tier'] = 'premium'
+        elif subscription['status'] in ['canceled', 'incomplete', 'past_due']:
+            fields['subscription_tier'] = 'free'
+        new_tier = fields.get('subscription_tier', profile.subscription_tier)
+
+        Profile.objects.filter(pk=profile.pk).update(**fields)
+
+        # Log if status changed
+        if old_status != subscription['status']:
+            SubscriptionHistory.objects.create(
+                user_id=profile.user_id,
+                from_tier='premium' if old_status == 'active' else 'free',
+                to_tier=new_tier,
+                change_type='upgrade' if new_tier == 'premium' else 'downgrade',
+                notes=f'Stripe webhook: subscription status changed to {subscription["status"]}'
+            )
+
+    except Profile.DoesNotExist:
+        pass  # Customer not found
+
+
+def _handle_subscription_deleted(subscription):
+    """Handle subscription deletion webhook."""
+    customer_id = subscription['customer']
+    cache.delete(subscription_cache_key(subscription['id']))
+    try:
+        profile = Profile.objects.only(
+            'id', 'user_id', 'subscription_tier'
+        ).get(stripe_customer_id=customer_id)
+
+        # Downgrade to free
+        old_tier = profile.subscription_tier
+        now = django_timezone.now()
+        Profile.objects.filter(pk=profile.pk).update(
+            subscription_tier='free',
+            subscription_status='canceled',
+            subscription_end_date=now,
+            updated_at=now,
+        )
+
+        # Log the change
+        SubscriptionHistory.objects.create(
+            user_id=profile.user_id,
+            from_tier=old_tier,
+            to_tier='free',
+            change_type='downgrade',
+            notes='Stripe webhook: subscription deleted'
+        )
+
+    except Profile.DoesNotExist:
+        pass
+
+
+def _handle_payment_succeeded(invoice):
+    """Handle successful payment webhook."""
+    from ..subscription_emails import send_payment_success_email
+
+    customer_id = invoice['customer']
+    ids = _profile_ids_for_customer(customer_id)
+    if not ids:
+        return  # Customer not found
+    _, user_id = ids
+
+    amount = invoice['amount_paid'] / 100  # Convert cents to dollars
+    period_end = datetime.fromtimestamp(invoice['period_end'], tz=timezone.utc)
+
+    # Create payment record
+    try:
+        with transaction.atomic():
+            Payment.objects.create(
+                user_id=user_id,
+                amount=amount,
+                status='completed',
+                payment_method='stripe',
+                stripe_payment_intent_id=invoice.get('payment_intent') or '',
+                stripe_customer_id=customer_id,
+                stripe_invoice_id=invoice.get('id') or '',
+                attempt_count=invoice.get('attempt_count'),
+                period_start=datetime.fromtimestamp(invoice['period_start'], tz=timezone.utc),
+                period_end=period_end,
+                completed_at=django_timezone.now(),
+            )
+    except IntegrityError as e:
+        if _violated_constraint(e) != 'payment_unique_completed_intent':
+            raise
+        return  # Already recorded by an earlier delivery of this invoice
+
+    # Send payment success email (only for actual charges, not $0 trial invoices)
+    if amount > 0:
+        user = _user_for_customer(customer_id, user_id)
+        if user is None:
+            return
+        profile = user.profile
+        plan_name = profile.get_subscription_plan_display() if hasattr(profile, 'get_subscription_plan_display') else profile.subscription_plan or 'Premium'
+        transaction.on_commit(
+            lambda: send_payment_success_email(user, amount, plan_name, period_end)
+        )
+
+
+def _handle_payment_failed(invoice):
+    """Handle failed payment webhook - immediately downgrade user."""
+    from ..subscription_emails import send_payment_failed_email
+
+    customer_id = invoice['customer']
+    ids = _profile_ids_for_customer(customer_id)
+    if not ids:
+        return  # Customer not found
+    profile_pk, user_id = ids
+
+    # Create failed payment record, one per invoice attempt
+    # (ON CONFLICT DO NOTHING: a redelivery of the same attempt is already recorded)
+    Payment.objects.bulk_create([
+        Payment(
+            user_id=user_id,
+            amount=invoice['amount_due'] / 100,
+            status='failed',
+            payment_method='stripe',
+            stripe_payment_intent_id=invoice.get('payment_intent') or '',
+            stripe_customer_id=customer_id,
+            stripe_invoice_id=invoice.get('id') or '',
+            attempt_count=invoice.get('attempt_count'),
+            period_start=datetime.fromtimestamp(invoice['period_start'], tz=timezone.utc),
+            period_end=datetime.fromtimestamp(invoice['period_end'], tz=timezone.utc),
+        )
+    ], ignore_conflicts=True)
+
+    # Immediately downgrade user on payment failure; a non-zero count means
+    # they were premium before
+    now = django_timezone.now()
+    downgraded = Profile.objects.filter(pk=profile_pk, subscription_tier='premium').update(
+        subscription_status='past_due',
+        subscription_tier='free',  # Downgrade immediately
+        updated_at=now,
+    )
+    if not downgraded:
+        Profile.objects.filter(pk=profile_pk).update(
+            subscription_status='past_due',
+            updated_at=now,
+        )
+
+    # Log the downgrade and send email
+    if downgraded:
+        SubscriptionHistory.objects.create(
+            user_id=user_id,
+            from_tier='premium',
+            to_tier='free',
+            change_type='payment_failed',
+            notes='Stripe webhook: payment failed - user downgraded to free'
+        )
+        # Send payment failed email once the downgrade is committed
+        user = _user_for_customer(customer_id, user_id)
+        if user is None:
+            return
+        transaction.on_commit(lambda: send_payment_failed_email(user))
+
+
+_HANDLERS = {
+    'customer.subscription.updated': _handle_subscription_updated,
+    'customer.subscription.deleted': _handle_subscription_deleted,
+    'invoice.payment_succeeded': _handle_payment_succeeded,
+    'invoice.payment_failed': _handle_payment_failed,
+}
@@ -5,7 +5,8 @@ Note: Profile creation signals are in models.py.
 This file contains additional friend/invitation signals.
 """
 import logging
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -139,56 +140,86 @@ def handle_password_set(sender, request, user, **kwargs):
         logger.error(f"Error handling password set for {user.email}: {e}")
 
 
-@receiver(post_save, sender=User)
-def send_welcome_email_on_signup(sender, instance, created, **kwargs):
+@receiver(post_save, sender=User, dispatch_uid='accounts_schedule_post_signup_work')
+def schedule_post_signup_work(sender, instance, created, **kwargs):
     """
-    Send welcome email when a new user signs up.
+    Link pending invitations to a new user, then queue the welcome email.
+
+    Invitations are marked 'signed_up' (or 'expired') here, synchronously,
+    so their status is settled before SignupForm.save() checks for a pending
+    family-plan invite. Only the welcome email is deferred: it runs after
+    the signup transaction commits so the worker sees the new row, and
+    keeps SMTP off the request thread. Falls back to running inline if
+    Redis/Celery isn't available.
     """
     if not created:
         return
 
-    # Delay import to avoid circular imports
-    from .subscription_emails import send_welcome_email
+    from django.db.models import Q
+    from django.utils import timezone
+    from apps.journal.signals import is_celery_available
+    from .models import Invitation
+    from .tasks import process_new_user_signup
 
-    try:
-        send_welcome_email(instance)
-    except Exception as e:
-        logger.error(f"Failed to send welcome email to {instance.email}: {e}")
+    # Link pending invitations to this email in two bulk UPDATEs
+    now = timezone.now()
+    pending_invitations = Invitation.objects.filter(
+        email__iexact=instance.email,
+        status='pending'
+    )
+    pending_invitations.filter(expires_at__lt=now).update(status='expired')
+    linked_count = pending_invitations.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gte=now)
+    ).update(recipient=instance, status='signed_up')
+
+    if linked_count:
+        logger.info(f"New user {instance.email} has {linked_count} pending invitation(s)")
+
+    user_id = instance.id
+
+    def dispatch():
+        if is_celery_available():
+            try:
+                process_new_user_signup.delay(user_id)
+                return
+            except Exception as e:
+                logger.warning(f"Could not queue post-signup work for user {user_id}: {e}")
+
+        try:
+            process_new_user_signup(user_id)
+        except Exception as e:
+            logger.error(f"Post-signup work failed for user {user_id}: {e}")
 
+    transaction.on_commit(dispatch)
 
-@receiver(post_save, sender=User)
-def handle_new_user_invitations(sender, instance, created, **kwargs):
+
+@receiver(post_save, sender=User, dispatch_uid='accounts_refresh_display_name')
+def refresh_display_name_on_email_change(sender, instance, created, update_fields=None, **kwargs):
     """
-    When a new user signs up, check for pending invitations.
+    Keep Profile.display_name in sync when a user without a username changes email.
 
-    Updates Invitation.recipient and status to 'signed_up'
-    so the new user can accept/deny from their settings.
+    display_name falls back to the email, so an email change (e.g. through
+    allauth's email management) must rewrite it too.
     """
-    if not created:
+    if created or (update_fields is not None and 'email' not in update_fields):
         return
 
-    from .models import Invitation
+    from django.db.models import Q
+    from .models import Profile
 
-    # Find pending invitations to this email
-    pending_invitations = Invitation.objects.filter(
-        email__iexact=instance.email,
-        status='pending'
-    )
+    Profile.objects.filter(
+        Q(username__isnull=True) | Q(username=''),
+        user=instance,
+    ).exclude(display_name=instance.email).update(display_name=instance.email)
 
-    updated_count = 0
-    for invitation in pending_invitations:
-        if not invitation.is_expired:
-            invitation.recipient = instance
-            invitation.status = 'signed_up'
-            invitation.save()
-            updated_count += 1
-            logger.info(
-                f"Linked invitation from {invitation.sender.email} "
-                f"to new user {instance.email}"
-            )
-        else:
-            invitation.status = 'expired'
-            invitation.save()
 
-    if updated_count:
-        logger.info(f"New user {instance.email} has {updated_count} pending invitation(s)")
+# =============================================================================
+# Stripe Customer Cache
+# =============================================================================
+
+@receiver(post_delete, sender='accounts.Profile', dispatch_uid='accounts_forget_customer_profile')
+def forget_deleted_customer_profile(sender, instance, **kwargs):
+    """Drop the cached webhook lookup for a deleted profile (or its cascaded user)."""
+    if instance.stripe_customer_id:
+        from .services.stripe_webhooks import forget_customer_profile
+        forget_customer_profile(instance.stripe_customer_id)
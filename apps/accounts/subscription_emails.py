@@ -1,8 +1,10 @@
 """
 Email functions for subscription-related notifications.
 """
+from functools import lru_cache
+
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 from django.template.loader import render_to_string
 from django.utils import timezone
 import logging
@@ -10,8 +12,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=1)
 def get_site_url():
-    """Get the site URL from settings."""
+    """Get the site URL from settings (resolved once per process)."""
     return getattr(settings, 'SITE_URL', 'https://myreflekt.net')
 
 
@@ -199,7 +202,8 @@ def send_payment_failed_email(user):
 ADMIN_EMAIL = getattr(settings, 'ADMIN_NOTIFICATION_EMAIL', 'fetter@zoho.com')
 
 
-def send_admin_new_subscriber_notification(user, plan_name, subscription_status, has_payment_method=True):
+def send_admin_new_subscriber_notification(user, plan_name, subscription_status, has_payment_method=True,
+                                           connection=None):
     """
     Send notification to admin when someone subscribes.
 
@@ -208,33 +212,36 @@ def send_admin_new_subscriber_notification(user, plan_name, subscription_status,
         plan_name: Name of the plan they selected (e.g., "Individual Monthly")
         subscription_status: Status from Stripe ("trialing" or "active")
         has_payment_method: Whether they entered payment info
+        connection: Optional open email connection to reuse
     """
     is_trial = subscription_status == 'trialing'
 
     subject = f"[Reflekt] New Subscriber: {user.email}"
 
-    message = f"""
-New Subscription on Reflekt!
-
-User: {user.email}
-Name: {user.profile.display_name or 'Not set'}
-Plan: {plan_name}
-Status: {'14-Day Trial' if is_trial else 'Active (Paid)'}
-Payment Method: {'Yes' if has_payment_method else 'No'}
-Signed Up: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
-
----
-View in Admin: {get_site_url()}/accounts/manage/users/{user.id}/
-"""
+    message = "\n".join([
+        "",
+        "New Subscription on Reflekt!",
+        "",
+        f"User: {user.email}",
+        f"Name: {user.profile.display_name or 'Not set'}",
+        f"Plan: {plan_name}",
+        f"Status: {'14-Day Trial' if is_trial else 'Active (Paid)'}",
+        f"Payment Method: {'Yes' if has_payment_method else 'No'}",
+        f"Signed Up: {timezone.now().isoformat(sep=' ', timespec='seconds')}",
+        "",
+        "---",
+        f"View in Admin: {get_site_url()}/accounts/manage/users/{user.id}/",
+        "",
+    ])
 
     try:
-        send_mail(
+        EmailMessage(
             subject=subject,
-            message=message,
+            body=message,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[ADMIN_EMAIL],
-            fail_silently=False,
-        )
+            to=[ADMIN_EMAIL],
+            connection=connection,
+        ).send(fail_silently=False)
         logger.info(f"Admin notification sent for new subscriber: {user.email}")
         return True
     except Exception as e:
@@ -242,32 +249,34 @@ View in Admin: {get_site_url()}/accounts/manage/users/{user.id}/
         return False
 
 
-def send_admin_subscription_cancelled_notification(user, plan_name):
+def send_admin_subscription_cancelled_notification(user, plan_name, connection=None):
     """
     Send notification to admin when someone cancels their subscription.
     """
     subject = f"[Reflekt] Subscription Cancelled: {user.email}"
 
-    message = f"""
-Subscription Cancelled on Reflekt
-
-User: {user.email}
-Name: {user.profile.display_name or 'Not set'}
-Previous Plan: {plan_name}
-Cancelled: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}
-
----
-View in Admin: {get_site_url()}/accounts/manage/users/{user.id}/
-"""
+    message = "\n".join([
+        "",
+        "Subscription Cancelled on Reflekt",
+        "",
+        f"User: {user.email}",
+        f"Name: {user.profile.display_name or 'Not set'}",
+        f"Previous Plan: {plan_name}",
+        f"Cancelled: {timezone.now().isoformat(sep=' ', timespec='seconds')}",
+        "",
+        "---",
+        f"View in Admin: {get_site_url()}/accounts/manage/users/{user.id}/",
+        "",
+    ])
 
     try:
-        send_mail(
+        EmailMessage(
             subject=subject,
-            message=message,
+            body=message,
             from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[ADMIN_EMAIL],
-            fail_silently=False,
-        )
+            to=[ADMIN_EMAIL],
+            connection=connection,
+        ).send(fail_silently=False)
         logger.info(f"Admin notification sent for cancelled subscription: {user.email}")
         return True
     except Exception as e:
@@ -1,26 +1,84 @@
 """
-Celery tasks for friend-related email notifications.
+Celery tasks for account-related background work and email notifications.
 """
+from functools import lru_cache
+from smtplib import SMTPException
+
 from celery import shared_task
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
 from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
+# How long a sent-email marker is kept to suppress duplicate sends on redelivery
+EMAIL_DEDUP_TTL = 3600
 
-@shared_task
-def send_friend_request_email(request_id):
+
+@lru_cache(maxsize=None)
+def _get_email_template(template_name):
+    """Resolve an email template once per worker process."""
+    return get_template(template_name)
+
+
+@lru_cache(maxsize=1)
+def _site_url():
+    """Site URL for email links (resolved once per worker process)."""
+    return getattr(settings, 'SITE_URL', 'http://localhost:8000')
+
+
+@lru_cache(maxsize=1)
+def _get_redis():
+    """Shared Redis client for email idempotency markers."""
+    import redis
+    return redis.from_url(settings.CELERY_BROKER_URL, socket_connect_timeout=1)
+
+
+def _email_dedup_key(task_name, object_id):
+    return f"emailed:{task_name}:{object_id}"
+
+
+def _claim_email_send(task_name, object_id):
+    """
+    Claim the single send of an email for (task, object).
+
+    Returns False if another delivery of the same task already claimed it.
+    If Redis can't be reached, the send is allowed.
+    """
+    try:
+        return bool(_get_redis().set(
+            _email_dedup_key(task_name, object_id), 1, nx=True, ex=EMAIL_DEDUP_TTL
+        ))
+    except Exception as e:
+        logger.warning(f"Email dedup check unavailable for {task_name}:{object_id}: {e}")
+        return True
+
+
+def _release_email_send(task_name, object_id):
+    """Drop a claim after a failed send so a retry can go through."""
+    try:
+        _get_redis().delete(_email_dedup_key(task_name, object_id))
+    except Exception:
+        pass
+
+
+@shared_task(bind=True, acks_late=True)
+def send_friend_request_email(self, request_id):
     """
     Send email notification for new friend request.
     """
     from .models import FriendRequest
 
+    if not _claim_email_send(self.name, request_id):
+        return f"Email for FriendRequest {request_id} already sent"
+
     try:
         request = FriendRequest.objects.select_related(
             'sender', 'sender__profile', 'recipient'
+        ).only(
+            'message', 'sender__email', 'sender__profile__display_name', 'recipient__email'
         ).get(id=request_id)
     except FriendRequest.DoesNotExist:
         return f"FriendRequest {request_id} not found"
@@ -31,35 +89,44 @@ def send_friend_request_email(request_id):
         'sender_name': sender_name,
         'sender_email': request.sender.email,
         'message': request.message,
-        'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+        'site_url': _site_url(),
     }
 
-    html_message = render_to_string('accounts/emails/friend_request.html', context)
-    plain_message = render_to_string('accounts/emails/friend_request.txt', context)
+    html_message = _get_email_template('accounts/emails/friend_request.html').render(context)
+    plain_message = _get_email_template('accounts/emails/friend_request.txt').render(context)
 
-    send_mail(
-        subject=f"{sender_name} wants to be your friend on Reflekt",
-        message=plain_message,
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[request.recipient.email],
-        fail_silently=False,
-    )
+    try:
+        msg = EmailMultiAlternatives(
+            subject=f"{sender_name} wants to be your friend on Reflekt",
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[request.recipient.email],
+        )
+        msg.attach_alternative(html_message, 'text/html')
+        msg.send(fail_silently=False)
+    except Exception:
+        _release_email_send(self.name, request_id)
+        raise
 
     logger.info(f"Friend request email sent to {request.recipient.email}")
     return f"Email sent to {request.recipient.email}"
 
 
-@shared_task
-def send_friend_request_accepted_email(request_id):
+@shared_task(bind=True, acks_late=True)
+def send_friend_request_accepted_email(self, request_id):
     """
     Notify sender that their friend request was accepted.
     """
     from .models import FriendRequest
 
+    if not _claim_email_send(self.name, request_id):
+        return f"Email for FriendRequest {request_id} already sent"
+
     try:
         request = FriendRequest.objects.select_related(
             'sender', 'recipient', 'recipient__profile'
+        ).only(
+            'sender__email', 'recipient__profile__display_name'
         ).get(id=request_id)
     except FriendRequest.DoesNotExist:
         return f"FriendRequest {request_id} not found"
@@ -68,79 +135,106 @@ def send_friend_request_accepted_email(request_id):
 
     context = {
         'accepter_name': accepter_name,
-        'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+        'site_url': _site_url(),
     }
 
-    html_message = render_to_string('accounts/emails/friend_request_accepted.html', context)
-    plain_message = render_to_string('accounts/emails/friend_request_accepted.txt', context)
+    html_message = _get_email_template('accounts/emails/friend_request_accepted.html').render(context)
+    plain_message = _get_email_template('accounts/emails/friend_request_accepted.txt').render(context)
 
-    send_mail(
-        subject=f"{accepter_name} accepted your friend request on Reflekt",
-        message=plain_message,
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[request.sender.email],
-        fail_silently=False,
-    )
+    try:
+        msg = EmailMultiAlternatives(
+            subject=f"{accepter_name} accepted your friend request on Reflekt",
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[request.sender.email],
+        )
+        msg.attach_alternative(html_message, 'text/html')
+        msg.send(fail_silently=False)
+    except Exception:
+        _release_email_send(self.name, request_id)
+        raise
 
     logger.info(f"Acceptance email sent to {request.sender.email}")
     return f"Email sent to {request.sender.email}"
 
 
-@shared_task
-def send_invitation_email(invitation_id):
+@shared_task(bind=True, acks_late=True)
+def send_invitation_email(self, invitation_id):
     """
     Send invitation email to non-user.
     """
     from .models import Invitation
 
+    if not _claim_email_send(self.name, invitation_id):
+        return f"Email for Invitation {invitation_id} already sent"
+
     try:
         invitation = Invitation.objects.select_related(
             'sender', 'sender__profile'
+        ).only(
+            'email', 'message', 'token',
+            'sender__email', 'sender__profile__display_name'
         ).get(id=invitation_id)
     except Invitation.DoesNotExist:
         return f"Invitation {invitation_id} not found"
 
+    # Persist the send marker before handing off to SMTP; only one worker
+    # wins, and cancelled invitations are never emailed
+    claimed = Invitation.objects.filter(
+        id=invitation_id,
+        status='pending',
+        email_sent_at__isnull=True
+    ).update(email_sent_at=timezone.now())
+    if not claimed:
+        return f"Invitation {invitation_id} already emailed or no longer pending"
+
     sender_name = invitation.sender.profile.display_name
+    site_url = _site_url()
 
     context = {
         'sender_name': sender_name,
         'sender_email': invitation.sender.email,
         'message': invitation.message,
-        'signup_url': f"{getattr(settings, 'SITE_URL', 'http://localhost:8000')}/accounts/signup/?invite={invitation.token}",
-        'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+        'signup_url': f"{site_url}/accounts/signup/?invite={invitation.token}",
+        'site_url': site_url,
     }
 
-    html_message = render_to_string('accounts/emails/invitation.html', context)
-    plain_message = render_to_string('accounts/emails/invitation.txt', context)
-
-    send_mail(
-        subject=f"{sender_name} invited you to join Reflekt",
-        message=plain_message,
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[invitation.email],
-        fail_silently=False,
-    )
+    html_message = _get_email_template('accounts/emails/invitation.html').render(context)
+    plain_message = _get_email_template('accounts/emails/invitation.txt').render(context)
 
-    # Update email_sent_at
-    invitation.email_sent_at = timezone.now()
-    invitation.save(update_fields=['email_sent_at'])
+    try:
+        msg = EmailMultiAlternatives(
+            subject=f"{sender_name} invited you to join Reflekt",
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[invitation.email],
+        )
+        msg.attach_alternative(html_message, 'text/html')
+        msg.send(fail_silently=False)
+    except Exception:
+        Invitation.objects.filter(id=invitation_id).update(email_sent_at=None)
+        _release_email_send(self.name, invitation_id)
+        raise
 
     logger.info(f"Invitation email sent to {invitation.email}")
     return f"Email sent to {invitation.email}"
 
 
-@shared_task
-def send_invitation_accepted_email(invitation_id):
+@shared_task(bind=True, acks_late=True)
+def send_invitation_accepted_email(self, invitation_id):
     """
     Notify inviter that invited person signed up and accepted.
     """
     from .models import Invitation
 
+    if not _claim_email_send(self.name, invitation_id):
+        return f"Email for Invitation {invitation_id} already sent"
+
     try:
         invitation = Invitation.objects.select_related(
             'sender', 'recipient', 'recipient__profile'
+        ).only(
+            'sender__email', 'recipient__email', 'recipient__profile__display_name'
         ).get(id=invitation_id)
     except Invitation.DoesNotExist:
         return f"Invitation {invitation_id} not found"
@@ -150,20 +244,141 @@ def send_invitation_accepted_email(invitation_id):
     context = {
         'new_friend_name': new_friend_name,
         'new_friend_email': invitation.recipient.email,
-        'site_url': getattr(settings, 'SITE_URL', 'http://localhost:8000'),
+        'site_url': _site_url(),
     }
 
-    html_message = render_to_string('accounts/emails/invitation_accepted.html', context)
-    plain_message = render_to_string('accounts/emails/invitation_accepted.txt', context)
+    html_message = _get_email_template('accounts/emails/invitation_accepted.html').render(context)
+    plain_message = _get_email_template('accounts/emails/invitation_accepted.txt').render(context)
 
-    send_mail(
-        subject=f"{new_friend_name} joined Reflekt and is now your friend!",
-        message=plain_message,
-        html_message=html_message,
-        from_email=settings.DEFAULT_FROM_EMAIL,
-        recipient_list=[invitation.sender.email],
-        fail_silently=False,
-    )
+    try:
+        msg = EmailMultiAlternatives(
+            subject=f"{new_friend_name} joined Reflekt and is now your friend!",
+            body=plain_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[invitation.sender.email],
+        )
+        msg.attach_alternative(html_message, 'text/html')
+        msg.send(fail_silently=False)
+    except Exception:
+        _release_email_send(self.name, invitation_id)
+        raise
 
     logger.info(f"Invitation accepted email sent to {invitation.sender.email}")
     return f"Email sent to {invitation.sender.email}"
+
+
+@shared_task
+def process_new_user_signup(user_id):
+    """
+    Post-signup work for a new user: sends the welcome email.
+
+    Pending invitations are linked synchronously by the post_save receiver,
+    before the signup form's family-invite check runs.
+    """
+    from django.contrib.auth.models import User
+    from .subscription_emails import send_welcome_email
+
+    try:
+        user = User.objects.select_related('profile').get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+
+    send_welcome_email(user)
+
+    return f"Post-signup work done for {user.email}"
+
+
+@shared_task(bind=True, acks_late=True, autoretry_for=(SMTPException,), retry_backoff=True, max_retries=5)
+def send_family_invite_email(self, recipient, subject, template_name, context):
+    """
+    Send a family plan invitation.
+
+    template_name is the path without extension; both the .html and .txt
+    variants are rendered here from the worker's cached templates.
+    """
+    html_message = _get_email_template(f'{template_name}.html').render(context)
+    plain_message = _get_email_template(f'{template_name}.txt').render(context)
+
+    msg = EmailMultiAlternatives(
+        subject=subject,
+        body=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient],
+    )
+    msg.attach_alternative(html_message, 'text/html')
+    msg.send(fail_silently=False)
+
+    logger.info(f"Family invitation email sent to {recipient}")
+    return f"Family invitation sent to {recipient}"
+
+
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True, max_retries=5)
+def process_stripe_event(self, event_id, event_type, data_object):
+    """
+    Apply a verified Stripe webhook event (queued by stripe_webhook).
+    """
+    from django.core.cache import cache
+    from .services.stripe_webhooks import dispatch_stripe_event, stripe_event_cache_key
+
+    try:
+        dispatch_stripe_event(event_type, data_object)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            # Out of retries: release the dedup key so Stripe's own redelivery
+            # of this event is processed instead of skipped
+            cache.delete(stripe_event_cache_key(event_id))
+            logger.error(f"Stripe event {event_id} ({event_type}) failed after {self.max_retries} retries: {exc}")
+            raise
+        logger.warning(f"Stripe event {event_id} ({event_type}) failed: {exc}")
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries * 30)
+
+    return f"Processed Stripe event {event_id} ({event_type})"
+
+
+# =============================================================================
+# Admin Notification Tasks
+# =============================================================================
+# Routed to the low-priority 'admin_notifications' queue (see CELERY_TASK_ROUTES)
+# so a slow SMTP server never stalls checkout/webhook requests or user-facing mail.
+
+@shared_task(bind=True, acks_late=True, max_retries=5)
+def send_admin_new_subscriber_email(self, user_id, plan_name, subscription_status, has_payment_method=True):
+    """
+    Notify admin of a new subscriber.
+    """
+    from django.contrib.auth.models import User
+    from .subscription_emails import send_admin_new_subscriber_notification
+
+    try:
+        user = User.objects.select_related('profile').get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+
+    if not send_admin_new_subscriber_notification(
+        user=user,
+        plan_name=plan_name,
+        subscription_status=subscription_status,
+        has_payment_method=has_payment_method,
+    ):
+        raise self.retry()
+
+    return f"Admin notified of new subscriber {user.email}"
+
+
+@shared_task(bind=True, acks_late=True, max_retries=5)
+def send_admin_subscription_cancelled_email(self, user_id, plan_name):
+    """
+    Notify admin of a cancelled subscription.
+    """
+    from django.contrib.auth.models import User
+    from .subscription_emails import send_admin_subscription_cancelled_notification
+
+    try:
+        user = User.objects.select_related('profile').get(id=user_id)
+    except User.DoesNotExist:
+        return f"User {user_id} not found"
+
+    if not send_admin_subscription_cancelled_notification(user, plan_name):
+        raise self.retry()
+
+    return f"Admin notified of cancellation by {user.email}"
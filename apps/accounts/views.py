@@ -1,15 +1,32 @@
+import stripe
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST, require_GET
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import conditional_page, require_POST, require_GET
+from django.views.decorators.cache import cache_page
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.vary import vary_on_headers
 from django.core.validators import validate_email
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
 from django.utils import timezone as django_timezone
 from django.views.generic import TemplateView
-
-from .models import Profile, Friendship, FriendRequest, Invitation
+from datetime import datetime, timedelta
+from functools import lru_cache, wraps
+import hashlib
+import json
+import logging
+import time
+
+from .models import (
+    Profile, Friendship, FriendRequest, Invitation, FamilyMember, Feedback,
+    SubscriptionHistory, UserBadge, STREAK_BADGES,
+)
 from .services.friends import (
     send_friend_request,
     accept_friend_request,
@@ -23,15 +40,21 @@ from .services.friends import (
     search_users_by_username,
     FriendshipError,
 )
+from .services.stripe_webhooks import (
+    dispatch_stripe_event,
+    forget_customer_profile,
+    stripe_event_cache_key,
+    subscription_cache_key,
+)
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
 def profile_view(request):
     """User profile and settings page."""
-    from datetime import timedelta
     from django.utils import timezone
     from apps.journal.models import Entry
-    from .models import UserBadge, STREAK_BADGES
 
     profile = request.user.profile
     friends = Friendship.get_friends(request.user)
@@ -93,7 +116,6 @@ def profile_update(request):
             # Handle birthday
             birthday_str = request.POST.get('birthday', '')
             if birthday_str:
-                from datetime import datetime
                 try:
                     profile.birthday = datetime.strptime(birthday_str, '%Y-%m-%d').date()
                 except ValueError:
@@ -113,13 +135,18 @@ def profile_update(request):
             profile.enable_intimacy_tracking = request.POST.get('enable_intimacy_tracking') == '1'
             profile.enable_cycle_tracking = request.POST.get('enable_cycle_tracking') == '1'
 
-            profile.save()
+            profile.save(update_fields=[
+                'city', 'country_code', 'temperature_unit', 'birthday',
+                'horoscope_enabled', 'devotion_enabled', 'gender',
+                'enable_intimacy_tracking', 'enable_cycle_tracking', 'updated_at',
+            ])
             messages.success(request, 'Insights settings updated successfully.')
             return redirect('accounts:profile')
 
         # Handle main preferences form
         profile.timezone = request.POST.get('timezone', profile.timezone)
         profile.editor_preference = request.POST.get('editor_preference', profile.editor_preference)
+        dirty_fields = ['timezone', 'editor_preference', 'updated_at']
 
         # Handle username update
         new_username = request.POST.get('username', '').strip().lower()
@@ -132,15 +159,20 @@ def profile_update(request):
                 if not new_username.replace('_', '').isalnum():
                     messages.error(request, 'Username can only contain letters, numbers, and underscores.')
                     return redirect('accounts:profile')
-                if Profile.objects.filter(username=new_username).exclude(user=request.user).exists():
-                    messages.error(request, 'This username is already taken.')
-                    return redirect('accounts:profile')
                 profile.username = new_username
+                dirty_fields.append('username')
         elif profile.username and not new_username:
             # Allow clearing username
             profile.username = None
+            dirty_fields.append('username')
 
-        profile.save()
+        # Username uniqueness is enforced by the database unique index
+        try:
+            with transaction.atomic():
+                profile.save(update_fields=dirty_fields)
+        except IntegrityError:
+            messages.error(request, 'This username is already taken.')
+            return redirect('accounts:profile')
         messages.success(request, 'Profile updated successfully.')
         return redirect('accounts:profile')
     return redirect('accounts:profile')
@@ -192,12 +224,6 @@ def accept_friend_request_view(request, request_id):
     except FriendshipError as e:
         messages.error(request, str(e))
 
-    if request.headers.get('HX-Request'):
-        # HTMX request - return updated pending list
-        pending = get_pending_friend_requests(request.user)
-        return render(request, 'accounts/friends/partials/_pending_requests.html', {
-            'pending_received': pending['received'],
-        })
     return redirect('accounts:profile')
 
 
@@ -211,11 +237,6 @@ def deny_friend_request_view(request, request_id):
     except FriendshipError as e:
         messages.error(request, str(e))
 
-    if request.headers.get('HX-Request'):
-        pending = get_pending_friend_requests(request.user)
-        return render(request, 'accounts/friends/partials/_pending_requests.html', {
-            'pending_received': pending['received'],
-        })
     return redirect('accounts:profile')
 
 
@@ -275,16 +296,15 @@ def deny_invitation_view(request, invitation_id):
 @require_POST
 def cancel_invitation_view(request, invitation_id):
     """Cancel a sent invitation."""
-    try:
-        invitation = Invitation.objects.get(
-            id=invitation_id,
-            sender=request.user,
-            status='pending'
-        )
-        invitation.status = 'cancelled'
-        invitation.save()
+    # Single conditional UPDATE so a concurrent send/cancel can't both win
+    cancelled = Invitation.objects.filter(
+        id=invitation_id,
+        sender=request.user,
+        status='pending'
+    ).update(status='cancelled')
+    if cancelled:
         messages.info(request, 'Invitation cancelled.')
-    except Invitation.DoesNotExist:
+    else:
         messages.error(request, 'Invitation not found.')
 
     return redirect('accounts:profile')
@@ -299,10 +319,10 @@ def search_users_view(request):
 
     results = [
         {
-            'id': p.user.id,
-            'username': p.username,
-            'display_name': p.display_name,
-            'email': p.user.email,
+            'id': p['user_id'],
+            'username': p['username'],
+            'display_name': p['display_name'],
+            'email': p['user__email'],
         }
         for p in profiles
     ]
@@ -313,9 +333,9 @@ def search_users_view(request):
 @login_required
 def friends_list_api(request):
     """API endpoint to get current user's friends list for @ mention autocomplete."""
-    from .models import Friendship
 
-    friends = Friendship.get_friends(request.user)
+    # Only friends with usernames, already sorted by username
+    friends = Friendship.get_friends_with_usernames(request.user)
 
     results = [
         {
@@ -323,12 +343,9 @@ def friends_list_api(request):
             'username': f.profile.username,
             'display_name': f.profile.display_name,
         }
-        for f in friends if f.profile.username  # Only include friends with usernames
+        for f in friends
     ]
 
-    # Sort alphabetically by username
-    results.sort(key=lambda x: x['username'].lower())
-
     return JsonResponse({'friends': results})
 
 
@@ -336,33 +353,59 @@ def friends_list_api(request):
 # Subscription / Pricing Views
 # =============================================================================
 
+STATIC_PAGE_CACHE_TIMEOUT = 60 * 5
+
+
+def _cache_for_anonymous(view_func):
+    """
+    Serve a public page from the cache for anonymous visitors.
+
+    Signed-in users always get a fresh render, since these templates show
+    their plan and account links. Responses carry an ETag so unchanged
+    GETs can be answered with a 304.
+    """
+    cached_view = cache_page(STATIC_PAGE_CACHE_TIMEOUT)(
+        vary_on_headers('Accept-Language', 'Cookie')(view_func)
+    )
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+        return cached_view(request, *args, **kwargs)
+
+    return conditional_page(wrapper)
+
+
+@_cache_for_anonymous
 def pricing_view(request):
     """Public pricing page."""
     return render(request, 'accounts/pricing.html')
 
 
+# Signup message for each selectable plan
+_PLAN_MESSAGES = {
+    'free': 'Create your free account to start journaling!',
+    'individual_monthly': 'Create your account to continue with Individual (monthly) plan.',
+    'individual_yearly': 'Create your account to continue with Individual (yearly) plan.',
+    'family_monthly': 'Create your account to continue with Family (monthly) plan.',
+    'family_yearly': 'Create your account to continue with Family (yearly) plan.',
+}
+_VALID_PLANS = frozenset(_PLAN_MESSAGES)
+
+
 def select_plan(request):
     """Store selected plan in session and redirect to signup."""
     plan = request.GET.get('plan', 'free')
 
-    # Valid plan choices
-    valid_plans = ['free', 'individual_monthly', 'individual_yearly', 'family_monthly', 'family_yearly']
-
-    if plan not in valid_plans:
+    if plan not in _VALID_PLANS:
         plan = 'free'
 
     # Store plan in session
     request.session['selected_plan'] = plan
 
     # Add a message about the selected plan
-    if plan == 'free':
-        messages.info(request, 'Create your free account to start journaling!')
-    elif 'individual' in plan:
-        period = 'monthly' if 'monthly' in plan else 'yearly'
-        messages.info(request, f'Create your account to continue with Individual ({period}) plan.')
-    else:  # family plan
-        period = 'monthly' if 'monthly' in plan else 'yearly'
-        messages.info(request, f'Create your account to continue with Family ({period}) plan.')
+    messages.info(request, _PLAN_MESSAGES[plan])
 
     # Redirect to signup
     return redirect('account_signup')
@@ -382,10 +425,6 @@ def process_plan_selection(request):
         return redirect('analytics:dashboard')
 
     # For paid plans, create checkout session
-    import stripe
-    from django.conf import settings
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
     price_id = settings.STRIPE_PRICE_IDS.get(pending_plan)
 
     if not price_id:
@@ -395,37 +434,11 @@ def process_plan_selection(request):
     try:
         # Create or get Stripe customer
         profile = request.user.profile
-        if profile.stripe_customer_id:
-            customer_id = profile.stripe_customer_id
-        else:
-            customer = stripe.Customer.create(
-                email=request.user.email,
-                metadata={
-                    'user_id': request.user.id,
-                }
-            )
-            customer_id = customer.id
-            profile.stripe_customer_id = customer_id
-            profile.save()
+        customer_id = _get_or_create_stripe_customer(request.user, profile)
 
         # Create checkout session with 14-day trial
-        checkout_session = stripe.checkout.Session.create(
-            customer=customer_id,
-            payment_method_types=['card'],
-            line_items=[{
-                'price': price_id,
-                'quantity': 1,
-            }],
-            mode='subscription',
-            subscription_data={
-                'trial_period_days': 14,  # 14-day free trial
-            },
-            success_url=request.build_absolute_uri('/accounts/checkout/success/') + '?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=request.build_absolute_uri('/accounts/checkout/cancel/'),
-            metadata={
-                'user_id': request.user.id,
-                'plan': pending_plan,
-            },
+        checkout_session = _create_checkout_session(
+            request, customer_id, pending_plan, price_id, with_trial=True
         )
 
         return redirect(checkout_session.url)
@@ -438,6 +451,90 @@ def process_plan_selection(request):
         return redirect('accounts:pricing')
 
 
+STRIPE_CUSTOMER_CACHE_TIMEOUT = 3600
+
+
+@lru_cache(maxsize=16)
+def _checkout_urls(scheme, host):
+    """Stripe checkout success/cancel URLs, built once per scheme and host."""
+    base = f"{scheme}://{host}"
+    return (
+        f"{base}/accounts/checkout/success/?session_id={{CHECKOUT_SESSION_ID}}",
+        f"{base}/accounts/checkout/cancel/",
+    )
+
+
+# Checkout.Session.create arguments shared by every subscription checkout
+_STATIC_CHECKOUT_KWARGS = {
+    'payment_method_types': ['card'],
+    'mode': 'subscription',
+}
+_TRIAL_SUBSCRIPTION_DATA = {'trial_period_days': 14}  # 14-day free trial
+
+
+def _create_checkout_session(request, customer_id, plan, price_id, with_trial):
+    """
+    Create a Stripe subscription checkout session for the requesting user.
+
+    The idempotency key is bucketed per minute, so a double-clicked submit
+    returns the same session instead of creating a second one. It also hashes
+    the session parameters: Stripe rejects a reused key whose parameters
+    differ (e.g. the trial flag or price), so such a request gets its own key.
+    """
+    success_url, cancel_url = _checkout_urls(request.scheme, request.get_host())
+    params = {
+        'customer': customer_id,
+        'line_items': [{
+            'price': price_id,
+            'quantity': 1,
+        }],
+        'subscription_data': _TRIAL_SUBSCRIPTION_DATA if with_trial else None,
+        'success_url': success_url,
+        'cancel_url': cancel_url,
+        'metadata': {
+            'user_id': request.user.id,
+            'plan': plan,
+        },
+        **_STATIC_CHECKOUT_KWARGS,
+    }
+    params_hash = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+    return stripe.checkout.Session.create(
+        idempotency_key=f"co-{request.user.id}-{int(time.time() // 60)}-{params_hash}",
+        **params,
+    )
+
+
+def _get_or_create_stripe_customer(user, profile):
+    """
+    Return the user's Stripe customer ID, creating the customer only once.
+
+    Checks the profile, then the cache, before calling Stripe. Creation uses an
+    idempotency key so a retried/double-submitted request can't create a
+    second customer, and only the stripe_customer_id column is written.
+    """
+
+    cache_key = f"stripe_cust:{user.id}"
+    customer_id = profile.stripe_customer_id or cache.get(cache_key)
+
+    if not customer_id:
+        customer = stripe.Customer.create(
+            email=user.email,
+            metadata={
+                'user_id': user.id,
+            },
+            idempotency_key=f"cust-{user.id}",
+        )
+        customer_id = customer.id
+
+    if profile.stripe_customer_id != customer_id:
+        Profile.objects.filter(pk=profile.pk).update(stripe_customer_id=customer_id)
+        profile.stripe_customer_id = customer_id
+        forget_customer_profile(customer_id)
+
+    cache.set(cache_key, customer_id, STRIPE_CUSTOMER_CACHE_TIMEOUT)
+    return customer_id
+
+
 @login_required
 def upgrade_view(request):
     """Upgrade to premium page - redirects to pricing."""
@@ -448,10 +545,6 @@ def upgrade_view(request):
 @require_POST
 def create_checkout(request):
     """Create Stripe checkout session for subscription."""
-    import stripe
-    from django.conf import settings
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
     plan = request.POST.get('plan', 'individual_monthly')
 
     # Validate plan
@@ -467,47 +560,17 @@ def create_checkout(request):
     try:
         # Create or get Stripe customer
         profile = request.user.profile
-        if profile.stripe_customer_id:
-            customer_id = profile.stripe_customer_id
-        else:
-            customer = stripe.Customer.create(
-                email=request.user.email,
-                metadata={
-                    'user_id': request.user.id,
-                }
-            )
-            customer_id = customer.id
-            profile.stripe_customer_id = customer_id
-            profile.save()
+        customer_id = _get_or_create_stripe_customer(request.user, profile)
 
         # Check if user is eligible for free trial (first-time subscribers only)
-        from .models import SubscriptionHistory
         has_previous_subscription = SubscriptionHistory.objects.filter(
             user=request.user,
             to_tier='premium'
         ).exists() or profile.stripe_subscription_id
 
-        # Build subscription data - only include trial for first-time subscribers
-        subscription_data = {}
-        if not has_previous_subscription:
-            subscription_data['trial_period_days'] = 14  # 14-day free trial
-
-        # Create checkout session
-        checkout_session = stripe.checkout.Session.create(
-            customer=customer_id,
-            payment_method_types=['card'],
-            line_items=[{
-                'price': price_id,
-                'quantity': 1,
-            }],
-            mode='subscription',
-            subscription_data=subscription_data if subscription_data else None,
-            success_url=request.build_absolute_uri('/accounts/checkout/success/') + '?session_id={CHECKOUT_SESSION_ID}',
-            cancel_url=request.build_absolute_uri('/accounts/checkout/cancel/'),
-            metadata={
-                'user_id': request.user.id,
-                'plan': plan,
-            },
+        # Create checkout session - only include trial for first-time subscribers
+        checkout_session = _create_checkout_session(
+            request, customer_id, plan, price_id, with_trial=not has_previous_subscription
         )
 
         return redirect(checkout_session.url)
@@ -526,11 +589,6 @@ def checkout_success(request):
     session_id = request.GET.get('session_id')
 
     if session_id:
-        import stripe
-        from django.conf import settings
-
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
         try:
             # Retrieve the session
             session = stripe.checkout.Session.retrieve(session_id)
@@ -538,17 +596,18 @@ def checkout_success(request):
             # Retrieve the subscription to check status (active vs trialing)
             subscription = stripe.Subscription.retrieve(session.subscription)
 
-            # Update user profile
-            profile = request.user.profile
-            profile.stripe_subscription_id = session.subscription
-            profile.subscription_status = subscription.status  # 'active' or 'trialing'
-            profile.subscription_plan = session.metadata.get('plan')
-            profile.subscription_tier = 'premium'
-            profile.subscription_start_date = django_timezone.now()
-            profile.save()
+            # Update user profile (only the subscription columns)
+            now = django_timezone.now()
+            Profile.objects.filter(user=request.user).update(
+                stripe_subscription_id=session.subscription,
+                subscription_status=subscription.status,  # 'active' or 'trialing'
+                subscription_plan=session.metadata.get('plan'),
+                subscription_tier='premium',
+                subscription_start_date=now,
+                updated_at=now,
+            )
 
             # Log subscription change
-            from .models import SubscriptionHistory
             SubscriptionHistory.objects.create(
                 user=request.user,
                 from_tier='free',
@@ -561,22 +620,24 @@ def checkout_success(request):
             if subscription.status == 'trialing':
                 # Send trial started email
                 from .subscription_emails import send_trial_started_email
-                from datetime import datetime
                 trial_end = datetime.fromtimestamp(subscription.trial_end) if subscription.trial_end else None
                 send_trial_started_email(request.user, trial_end)
                 messages.success(request, '🎉 Your 14-day free trial has started! Enjoy all premium features.')
             else:
                 messages.success(request, '🎉 Welcome to Premium! All features are now unlocked.')
 
-            # Notify admin of new subscriber
-            from .subscription_emails import send_admin_new_subscriber_notification
+            # Notify admin of new subscriber (queued, off the request path)
             plan_name = session.metadata.get('plan', 'Unknown').replace('_', ' ').title()
-            send_admin_new_subscriber_notification(
-                user=request.user,
-                plan_name=plan_name,
-                subscription_status=subscription.status,
-                has_payment_method=True  # They completed checkout, so they have payment info
-            )
+            try:
+                from .tasks import send_admin_new_subscriber_email
+                send_admin_new_subscriber_email.delay(
+                    request.user.id,
+                    plan_name,
+                    subscription.status,
+                    True,  # They completed checkout, so they have payment info
+                )
+            except Exception as e:
+                logger.warning(f"Could not queue admin subscriber notification: {e}")
 
             return redirect('analytics:dashboard')
 
@@ -594,34 +655,48 @@ def checkout_cancel(request):
     return redirect('accounts:pricing')
 
 
+STRIPE_SUBSCRIPTION_CACHE_TIMEOUT = 60
+
+
+def _get_subscription_details(subscription_id):
+    """
+    Template-ready snapshot of a Stripe subscription, cached briefly.
+
+    Webhook handlers and the cancel views drop the entry when the
+    subscription changes, so the page doesn't show stale state.
+    """
+    cache_key = subscription_cache_key(subscription_id)
+    details = cache.get(cache_key)
+    if details is not None:
+        return details
+
+    try:
+        sub = stripe.Subscription.retrieve(subscription_id)
+    except stripe.error.StripeError:
+        return None  # Subscription not found or error
+
+    # Convert Stripe subscription to a dict with proper datetime objects
+    details = {
+        'id': sub.id,
+        'status': sub.status,
+        'cancel_at_period_end': sub.cancel_at_period_end,
+        'current_period_end': datetime.fromtimestamp(sub.current_period_end) if sub.current_period_end else None,
+        'current_period_start': datetime.fromtimestamp(sub.current_period_start) if sub.current_period_start else None,
+        'trial_end': datetime.fromtimestamp(sub.trial_end) if sub.trial_end else None,
+        'trial_start': datetime.fromtimestamp(sub.trial_start) if sub.trial_start else None,
+    }
+    cache.set(cache_key, details, STRIPE_SUBSCRIPTION_CACHE_TIMEOUT)
+    return details
+
+
 @login_required
 def manage_subscription(request):
     """Manage subscription - view details and cancel."""
-    from datetime import datetime
-
     profile = request.user.profile
 
     subscription_details = None
     if profile.stripe_subscription_id:
-        import stripe
-        from django.conf import settings
-
-        stripe.api_key = settings.STRIPE_SECRET_KEY
-
-        try:
-            sub = stripe.Subscription.retrieve(profile.stripe_subscription_id)
-            # Convert Stripe subscription to a dict with proper datetime objects
-            subscription_details = {
-                'id': sub.id,
-                'status': sub.status,
-                'cancel_at_period_end': sub.cancel_at_period_end,
-                'current_period_end': datetime.fromtimestamp(sub.current_period_end) if sub.current_period_end else None,
-                'current_period_start': datetime.fromtimestamp(sub.current_period_start) if sub.current_period_start else None,
-                'trial_end': datetime.fromtimestamp(sub.trial_end) if sub.trial_end else None,
-                'trial_start': datetime.fromtimestamp(sub.trial_start) if sub.trial_start else None,
-            }
-        except stripe.error.StripeError:
-            pass  # Subscription not found or error
+        subscription_details = _get_subscription_details(profile.stripe_subscription_id)
 
     return render(request, 'accounts/manage_subscription.html', {
         'profile': profile,
@@ -640,22 +715,21 @@ def cancel_subscription(request):
         messages.error(request, 'No active subscription found.')
         return redirect('accounts:manage_subscription')
 
-    import stripe
-    from django.conf import settings
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
-
     try:
         # Cancel at period end (user keeps access until end of billing period)
         subscription = stripe.Subscription.modify(
             profile.stripe_subscription_id,
             cancel_at_period_end=True
         )
+        cache.delete(subscription_cache_key(profile.stripe_subscription_id))
 
-        # Notify admin of cancellation
-        from .subscription_emails import send_admin_subscription_cancelled_notification
+        # Notify admin of cancellation (queued, off the request path)
         plan_name = profile.subscription_plan.replace('_', ' ').title() if profile.subscription_plan else 'Premium'
-        send_admin_subscription_cancelled_notification(request.user, plan_name)
+        try:
+            from .tasks import send_admin_subscription_cancelled_email
+            send_admin_subscription_cancelled_email.delay(request.user.id, plan_name)
+        except Exception as e:
+            logger.warning(f"Could not queue admin cancellation notification: {e}")
 
         messages.success(request, 'Your subscription has been cancelled. You will retain access until the end of your current billing period.')
         return redirect('accounts:manage_subscription')
@@ -665,15 +739,13 @@ def cancel_subscription(request):
         return redirect('accounts:manage_subscription')
 
 
+STRIPE_EVENT_DEDUP_TIMEOUT = 86400
+
+
 @csrf_exempt
 @require_POST
 def stripe_webhook(request):
     """Handle Stripe webhook events."""
-    import stripe
-    from django.conf import settings
-    from django.http import HttpResponse
-
-    stripe.api_key = settings.STRIPE_SECRET_KEY
     endpoint_secret = settings.STRIPE_WEBHOOK_SECRET
 
     payload = request.body
@@ -690,166 +762,27 @@ def stripe_webhook(request):
         # Invalid signature
         return HttpResponse(status=400)
 
-    # Handle the event
-    if event['type'] == 'customer.subscription.updated':
-        subscription = event['data']['object']
-        _handle_subscription_updated(subscription)
-
-    elif event['type'] == 'customer.subscription.deleted':
-        subscription = event['data']['object']
-        _handle_subscription_deleted(subscription)
-
-    elif event['type'] == 'invoice.payment_succeeded':
-        invoice = event['data']['object']
-        _handle_payment_succeeded(invoice)
-
-    elif event['type'] == 'invoice.payment_failed':
-        invoice = event['data']['object']
-        _handle_payment_failed(invoice)
-
-    return HttpResponse(status=200)
-
-
-def _handle_subscription_updated(subscription):
-    """Handle subscription update webhook."""
-    from .models import Profile, SubscriptionHistory
-    from django.contrib.auth.models import User
-
-    customer_id = subscription['customer']
-    try:
-        profile = Profile.objects.get(stripe_customer_id=customer_id)
-        old_status = profile.subscription_status
-
-        profile.subscription_status = subscription['status']
-        profile.stripe_subscription_id = subscription['id']
-
-        # Update tier based on status
-        if subscription['status'] == 'active':
-            profile.subscription_tier = 'premium'
-        elif subscription['status'] in ['canceled', 'incomplete', 'past_due']:
-            profile.subscription_tier = 'free'
-
-        profile.save()
-
-        # Log if status changed
-        if old_status != subscription['status']:
-            SubscriptionHistory.objects.create(
-                user=profile.user,
-                from_tier='premium' if old_status == 'active' else 'free',
-                to_tier=profile.subscription_tier,
-                change_type='upgrade' if profile.subscription_tier == 'premium' else 'downgrade',
-                notes=f'Stripe webhook: subscription status changed to {subscription["status"]}'
-            )
-
-    except Profile.DoesNotExist:
-        pass  # Customer not found
-
+    # Stripe redelivers events; only the first delivery of an event id is handled
+    event_key = stripe_event_cache_key(event['id'])
+    if not cache.add(event_key, 1, timeout=STRIPE_EVENT_DEDUP_TIMEOUT):
+        return HttpResponse(status=200)
 
-def _handle_subscription_deleted(subscription):
-    """Handle subscription deletion webhook."""
-    from .models import Profile, SubscriptionHistory
-
-    customer_id = subscription['customer']
-    try:
-        profile = Profile.objects.get(stripe_customer_id=customer_id)
-
-        # Downgrade to free
-        old_tier = profile.subscription_tier
-        profile.subscription_tier = 'free'
-        profile.subscription_status = 'canceled'
-        profile.subscription_end_date = django_timezone.now()
-        profile.save()
-
-        # Log the change
-        SubscriptionHistory.objects.create(
-            user=profile.user,
-            from_tier=old_tier,
-            to_tier='free',
-            change_type='downgrade',
-            notes='Stripe webhook: subscription deleted'
-        )
-
-    except Profile.DoesNotExist:
-        pass
-
-
-def _handle_payment_succeeded(invoice):
-    """Handle successful payment webhook."""
-    from .models import Profile, Payment
-    from .subscription_emails import send_payment_success_email
-    from datetime import datetime
-
-    customer_id = invoice['customer']
-    try:
-        profile = Profile.objects.get(stripe_customer_id=customer_id)
-
-        amount = invoice['amount_paid'] / 100  # Convert cents to dollars
-        period_end = datetime.fromtimestamp(invoice['period_end'])
-
-        # Create payment record
-        Payment.objects.create(
-            user=profile.user,
-            amount=amount,
-            status='completed',
-            payment_method='stripe',
-            stripe_payment_intent_id=invoice.get('payment_intent', ''),
-            stripe_customer_id=customer_id,
-            period_start=datetime.fromtimestamp(invoice['period_start']),
-            period_end=period_end,
-            completed_at=django_timezone.now(),
-        )
-
-        # Send payment success email (only for actual charges, not $0 trial invoices)
-        if amount > 0:
-            plan_name = profile.get_subscription_plan_display() if hasattr(profile, 'get_subscription_plan_display') else profile.subscription_plan or 'Premium'
-            send_payment_success_email(profile.user, amount, plan_name, period_end)
-
-    except Profile.DoesNotExist:
-        pass
-
-
-def _handle_payment_failed(invoice):
-    """Handle failed payment webhook - immediately downgrade user."""
-    from .models import Profile, Payment, SubscriptionHistory
-    from .subscription_emails import send_payment_failed_email
-    from datetime import datetime
-
-    customer_id = invoice['customer']
+    # Acknowledge right away; the handlers run on the Celery 'stripe' queue
+    event_type = event['type']
+    data_object = json.loads(payload)['data']['object']  # plain dict for the task
     try:
-        profile = Profile.objects.get(stripe_customer_id=customer_id)
-
-        # Create failed payment record
-        Payment.objects.create(
-            user=profile.user,
-            amount=invoice['amount_due'] / 100,
-            status='failed',
-            payment_method='stripe',
-            stripe_payment_intent_id=invoice.get('payment_intent', ''),
-            stripe_customer_id=customer_id,
-            period_start=datetime.fromtimestamp(invoice['period_start']),
-            period_end=datetime.fromtimestamp(invoice['period_end']),
-        )
-
-        # Immediately downgrade user on payment failure
-        old_tier = profile.subscription_tier
-        profile.subscription_status = 'past_due'
-        profile.subscription_tier = 'free'  # Downgrade immediately
-        profile.save()
-
-        # Log the downgrade and send email
-        if old_tier != 'free':
-            SubscriptionHistory.objects.create(
-                user=profile.user,
-                from_tier=old_tier,
-                to_tier='free',
-                change_type='payment_failed',
-                notes='Stripe webhook: payment failed - user downgraded to free'
-            )
-            # Send payment failed email
-            send_payment_failed_email(profile.user)
+        from apps.journal.signals import is_celery_available
+        if is_celery_available():
+            from .tasks import process_stripe_event
+            process_stripe_event.delay(event['id'], event_type, data_object)
+        else:
+            dispatch_stripe_event(event_type, data_object)
+    except Exception:
+        # Let Stripe's retry be processed instead of swallowed by the dedup key
+        cache.delete(event_key)
+        raise
 
-    except Profile.DoesNotExist:
-        pass
+    return HttpResponse(status=200)
 
 
 # =============================================================================
@@ -859,8 +792,6 @@ def _handle_payment_failed(invoice):
 @login_required
 def family_management(request):
     """Family plan management page for admins."""
-    from .models import FamilyMember
-
     profile = request.user.profile
 
     # Check if user has a family plan
@@ -870,9 +801,14 @@ def family_management(request):
         messages.warning(request, 'You need a Family plan to manage family members.')
         return redirect('accounts:upgrade')
 
-    # Get family members
-    family_members = FamilyMember.get_active_members(request.user)
-    member_count = family_members.count()
+    # Get family members in one query, with only the columns the page shows
+    family_members = list(
+        FamilyMember.get_active_members(request.user)
+        .select_related(None)
+        .select_related('member')
+        .only('id', 'created_at', 'member', 'member__email', 'member__first_name', 'member__last_name')
+    )
+    member_count = len(family_members)
     max_members = 4  # Maximum family members (configurable)
 
     return render(request, 'accounts/family_management.html', {
@@ -887,9 +823,6 @@ def family_management(request):
 @require_POST
 def remove_family_member(request, member_id):
     """Remove a member from the family plan."""
-    from .models import FamilyMember
-    from django.contrib.auth.models import User
-
     profile = request.user.profile
 
     # Check if user has a family plan
@@ -909,15 +842,18 @@ def remove_family_member(request, member_id):
             return JsonResponse({'success': False, 'error': 'Cannot remove yourself from the family plan'}, status=400)
 
         # Remove the member (soft delete)
-        family_member.status = 'removed'
-        family_member.removed_at = django_timezone.now()
-        family_member.removed_by = request.user
-        family_member.save()
+        now = django_timezone.now()
+        FamilyMember.objects.filter(pk=family_member.pk).update(
+            status='removed',
+            removed_at=now,
+            removed_by=request.user,
+        )
 
         # Downgrade the member to free tier
-        member_profile = family_member.member.profile
-        member_profile.subscription_tier = 'free'
-        member_profile.save()
+        Profile.objects.filter(user_id=family_member.member_id).update(
+            subscription_tier='free',
+            updated_at=now,
+        )
 
         messages.success(request, f'{family_member.member.email} has been removed from your family plan.')
 
@@ -930,20 +866,33 @@ def remove_family_member(request, member_id):
     except FamilyMember.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Family member not found'}, status=404)
     except Exception as e:
-        from django.conf import settings
         error_msg = str(e) if settings.DEBUG else 'An error occurred'
         return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
 
+def _queue_family_invite_email(recipient, subject, template_name, context):
+    """Queue a family invitation email, sending it inline if Celery isn't available."""
+    from apps.journal.signals import is_celery_available
+    from .tasks import send_family_invite_email
+
+    if is_celery_available():
+        try:
+            send_family_invite_email.delay(recipient, subject, template_name, context)
+            return
+        except Exception as e:
+            logger.warning(f"Could not queue family invitation to {recipient}: {e}")
+
+    try:
+        send_family_invite_email(recipient, subject, template_name, context)
+    except Exception as e:
+        logger.error(f"Failed to send family invitation to {recipient}: {e}")
+
+
 @login_required
 @require_POST
 def add_family_member(request):
     """Send invitation to join family plan by email."""
-    from .models import FamilyMember, Invitation, FriendRequest
-    from django.contrib.auth.models import User
-    from django.core.mail import send_mail
     from django.urls import reverse
-    from django.conf import settings
 
     profile = request.user.profile
 
@@ -951,14 +900,14 @@ def add_family_member(request):
     if profile.subscription_plan not in ['family_monthly', 'family_yearly']:
         return JsonResponse({'success': False, 'error': 'You do not have a family plan'}, status=403)
 
-    # Check family member limit (count active + pending)
-    current_count = FamilyMember.objects.filter(
+    # Check family member limit (active + pending); only probes for the Nth row
+    max_members = 4
+    limit_reached = FamilyMember.objects.filter(
         admin=request.user,
         status__in=['active', 'pending']
-    ).exclude(member=request.user).count()
-    max_members = 4
+    ).exclude(member=request.user)[max_members - 1:max_members].exists()
 
-    if current_count >= max_members:
+    if limit_reached:
         return JsonResponse({'success': False, 'error': f'Family plan limit reached ({max_members} members max)'}, status=400)
 
     # Get email from request
@@ -978,25 +927,23 @@ def add_family_member(request):
         return JsonResponse({'success': False, 'error': 'Cannot add yourself as a family member'}, status=400)
 
     # Try to find existing user
-    try:
-        member_user = User.objects.get(email=email)
-        user_exists = True
-    except User.DoesNotExist:
-        user_exists = False
-        member_user = None
+    member_user = User.objects.filter(email=email).only(
+        'id', 'email', 'first_name', 'last_name'
+    ).first()
+
+    if member_user:
+        # One query for both this family's membership and any other active family
+        memberships = list(FamilyMember.objects.filter(
+            Q(admin=request.user) | Q(status='active'),
+            member=member_user,
+        ).values_list('admin_id', 'status'))
 
-    if user_exists:
         # Check if already in this family (active or pending)
-        if FamilyMember.objects.filter(
-            admin=request.user,
-            member=member_user,
-            status__in=['active', 'pending']
-        ).exists():
+        if any(admin_id == request.user.id and status in ('active', 'pending') for admin_id, status in memberships):
             return JsonResponse({'success': False, 'error': 'This user already has an invitation or is in your family plan'}, status=400)
 
         # Check if member is in another family
-        existing_membership = FamilyMember.objects.filter(member=member_user, status='active').first()
-        if existing_membership:
+        if any(status == 'active' for _, status in memberships):
             return JsonResponse({'success': False, 'error': 'This user is already in another family plan'}, status=400)
 
         # Create pending invitation for existing user
@@ -1016,8 +963,7 @@ def add_family_member(request):
             admin_name = request.user.get_full_name() or request.user.email
             member_name = member_user.get_full_name() or member_user.email.split('@')[0]
 
-            # Use HTML email template
-            from django.template.loader import render_to_string
+            # Rendered by the worker from the HTML/text email templates
             email_context = {
                 'admin_name': admin_name,
                 'admin_email': request.user.email,
@@ -1025,16 +971,11 @@ def add_family_member(request):
                 'member_email': member_user.email,
                 'accept_url': accept_url,
             }
-            html_content = render_to_string('accounts/emails/family/invitation_existing_user.html', email_context)
-            txt_content = render_to_string('accounts/emails/family/invitation_existing_user.txt', email_context)
-
-            send_mail(
-                subject=f'[Reflekt] {admin_name} invited you to their Family Plan',
-                message=txt_content,
-                html_message=html_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
+            _queue_family_invite_email(
+                email,
+                f'[Reflekt] {admin_name} invited you to their Family Plan',
+                'accounts/emails/family/invitation_existing_user',
+                email_context,
             )
 
             return JsonResponse({
@@ -1043,7 +984,6 @@ def add_family_member(request):
             })
 
         except Exception as e:
-            from django.conf import settings
             error_msg = str(e) if settings.DEBUG else 'An error occurred'
             return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
@@ -1070,24 +1010,18 @@ def add_family_member(request):
             signup_url = request.build_absolute_uri('/accounts/signup/')
             admin_name = request.user.get_full_name() or request.user.email
 
-            # Use HTML email template
-            from django.template.loader import render_to_string
+            # Rendered by the worker from the HTML/text email templates
             email_context = {
                 'admin_name': admin_name,
                 'admin_email': request.user.email,
                 'invited_email': email,
                 'signup_url': signup_url,
             }
-            html_content = render_to_string('accounts/emails/family/invitation_new_user.html', email_context)
-            txt_content = render_to_string('accounts/emails/family/invitation_new_user.txt', email_context)
-
-            send_mail(
-                subject=f'[Reflekt] {admin_name} invited you to join Reflekt Family Plan',
-                message=txt_content,
-                html_message=html_content,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[email],
-                fail_silently=False,
+            _queue_family_invite_email(
+                email,
+                f'[Reflekt] {admin_name} invited you to join Reflekt Family Plan',
+                'accounts/emails/family/invitation_new_user',
+                email_context,
             )
 
             return JsonResponse({
@@ -1096,7 +1030,6 @@ def add_family_member(request):
             })
 
         except Exception as e:
-            from django.conf import settings
             error_msg = str(e) if settings.DEBUG else 'An error occurred'
             return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
@@ -1104,12 +1037,8 @@ def add_family_member(request):
 @login_required
 def accept_family_invitation(request, invitation_id):
     """Accept a family plan invitation."""
-    from .models import FamilyMember, FriendRequest
-    import stripe
-    from django.conf import settings
-
     try:
-        family_member = FamilyMember.objects.get(
+        family_member = FamilyMember.objects.select_related('admin').get(
             id=invitation_id,
             member=request.user,
             status='pending'
@@ -1122,42 +1051,43 @@ def accept_family_invitation(request, invitation_id):
         # Cancel existing subscription if user has one
         profile = request.user.profile
         if profile.stripe_subscription_id:
-            stripe.api_key = settings.STRIPE_SECRET_KEY
             try:
                 # Cancel at period end (no refund)
                 subscription = stripe.Subscription.modify(
                     profile.stripe_subscription_id,
                     cancel_at_period_end=True
                 )
+                cache.delete(subscription_cache_key(profile.stripe_subscription_id))
                 messages.info(request, 'Your current subscription will be cancelled at the end of the billing period. No refunds will be issued.')
             except stripe.error.StripeError:
                 # If subscription doesn't exist or already cancelled, continue
                 pass
 
-        # Accept the invitation
-        family_member.status = 'active'
-        family_member.save()
-
-        # Upgrade to premium through family plan
-        profile.subscription_tier = 'premium'
-        profile.save()
-
-        # Automatically add as friends
         admin = family_member.admin
 
-        # Check if already friends
-        from .models import Friendship
-        if not Friendship.objects.filter(
-            models.Q(user1=request.user, user2=admin) |
-            models.Q(user1=admin, user2=request.user)
-        ).exists():
-            # Check if friend request already exists
-            if not FriendRequest.objects.filter(
-                models.Q(sender=request.user, recipient=admin) |
-                models.Q(sender=admin, recipient=request.user),
+        # Stripe is called above, outside the transaction; the DB writes commit together
+        with transaction.atomic():
+            # Accept the invitation (only if it is still pending)
+            if not FamilyMember.objects.filter(pk=family_member.pk, status='pending').update(status='active'):
+                messages.error(request, 'Invitation not found or already processed.')
+                return redirect('accounts:profile')
+
+            # Upgrade to premium through family plan
+            Profile.objects.filter(pk=profile.pk).update(
+                subscription_tier='premium',
+                updated_at=django_timezone.now(),
+            )
+
+            # Automatically add as friends unless already friends or a request is pending
+            already_linked = Friendship.objects.filter(
+                Q(user1=request.user, user2=admin) |
+                Q(user1=admin, user2=request.user)
+            ).exists() or FriendRequest.objects.filter(
+                Q(sender=request.user, recipient=admin) |
+                Q(sender=admin, recipient=request.user),
                 status='pending'
-            ).exists():
-                # Create friendship directly
+            ).exists()
+            if not already_linked:
                 Friendship.objects.create(
                     user1=request.user,
                     user2=admin
@@ -1169,7 +1099,6 @@ def accept_family_invitation(request, invitation_id):
         # Send notification email to admin
         from django.core.mail import send_mail
         from django.template.loader import render_to_string
-        from django.conf import settings
 
         member_count = FamilyMember.objects.filter(admin=admin, status='active').exclude(member=admin).count()
 
@@ -1207,8 +1136,6 @@ def accept_family_invitation(request, invitation_id):
 @login_required
 def decline_family_invitation(request, invitation_id):
     """Decline a family plan invitation."""
-    from .models import FamilyMember
-
     try:
         family_member = FamilyMember.objects.get(
             id=invitation_id,
@@ -1232,11 +1159,13 @@ def decline_family_invitation(request, invitation_id):
 # Legal Pages
 # =============================================================================
 
+@_cache_for_anonymous
 def privacy_policy(request):
     """Privacy policy page."""
     return render(request, 'legal/privacy_policy.html')
 
 
+@_cache_for_anonymous
 def terms_of_service(request):
     """Terms of service page."""
     return render(request, 'legal/terms_of_service.html')
@@ -1246,9 +1175,6 @@ def terms_of_service(request):
 @require_POST
 def submit_feedback(request):
     """Handle feedback submission from the floating button."""
-    import json
-    from .models import Feedback
-
     try:
         data = json.loads(request.body)
         feedback_type = data.get('type', 'bug')
@@ -1277,7 +1203,6 @@ def submit_feedback(request):
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'Invalid request'}, status=400)
     except Exception as e:
-        from django.conf import settings
         error_msg = str(e) if settings.DEBUG else 'An error occurred'
         return JsonResponse({'success': False, 'error': error_msg}, status=500)
 
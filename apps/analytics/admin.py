@@ -29,10 +29,10 @@ class YearlyReviewAdmin(admin.ModelAdmin):
 
 @admin.register(TrackedBook)
 class TrackedBookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'author', 'status', 'started_date', 'finished_date', 'rating')
+    list_display = ('title', 'user', 'author', 'status', 'capture_count', 'started_date', 'finished_date', 'rating')
     list_filter = ('status', 'rating')
     search_fields = ('title', 'author', 'user__email')
-    readonly_fields = ('normalized_title', 'normalized_author', 'created_at', 'updated_at')
+    readonly_fields = ('normalized_title', 'normalized_author', 'capture_count', 'progress_percentage', 'created_at', 'updated_at')
     raw_id_fields = ('user',)
 
 
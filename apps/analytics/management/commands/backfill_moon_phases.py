@@ -11,9 +11,10 @@ Usage:
     python manage.py backfill_moon_phases --all  (include entries without analysis)
 """
 import math
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from django.contrib.auth.models import User
 
 from apps.journal.models import Entry
@@ -25,6 +26,7 @@ MOON_PHASES = [
     'full_moon', 'waning_gibbous', 'last_quarter', 'waning_crescent',
 ]
 SYNODIC_MONTH = 29.53058867
+SYNODIC_SECONDS = round(SYNODIC_MONTH * 86400)
 KNOWN_NEW_MOON = datetime(2000, 1, 6, 18, 14, 0)
 
 
@@ -36,27 +38,127 @@ def calculate_moon_phase(target_date):
     else:
         target_dt = target_date
 
-    # Calculate days since known new moon
-    diff = target_dt - KNOWN_NEW_MOON
-    days_since = diff.total_seconds() / 86400.0
+    # Whole seconds into the current lunar cycle (integer math, no float modulo)
+    seconds_since = (target_dt - KNOWN_NEW_MOON) // timedelta(seconds=1)
+    cycle_seconds = seconds_since % SYNODIC_SECONDS
 
     # Calculate position in lunar cycle (0 to 1)
-    lunar_cycle = (days_since % SYNODIC_MONTH) / SYNODIC_MONTH
+    lunar_cycle = cycle_seconds / SYNODIC_SECONDS
 
     # Calculate illumination
     illumination_decimal = (1 - math.cos(lunar_cycle * 2 * math.pi)) / 2
     illumination_percent = illumination_decimal * 100
 
     # Determine phase name
-    phase_index = int(lunar_cycle * 8) % 8
+    phase_index = cycle_seconds * 8 // SYNODIC_SECONDS
     phase_name = MOON_PHASES[phase_index]
 
     return phase_name, round(illumination_percent, 1)
 
 
+# Rows fetched per round-trip, and analyses written per bulk UPDATE
+FETCH_SIZE = 2000
+BATCH_SIZE = 5000
+
+# Minimum seconds between progress lines in the processing loop
+PROGRESS_INTERVAL = 1.0
+
+
 class Command(BaseCommand):
     help = 'Backfill moon phase data for existing entries'
 
+    def _flush(self, analyses):
+        """Write a batch of updated analyses in a single transaction."""
+        if not analyses:
+            return
+        with transaction.atomic():
+            EntryAnalysis.objects.bulk_update(
+                analyses, ['moon_phase', 'moon_illumination'], batch_size=BATCH_SIZE
+            )
+
+    def _backfill_in_python(self, entries):
+        """Compute moon phases row by row, writing each batch with one bulk UPDATE."""
+        updated = 0
+        errors = []
+        pending = []
+        # Many entries share a date; compute each date's phase only once
+        phase_by_date = {}
+        last_progress = time.monotonic()
+
+        for i, entry in enumerate(entries.iterator(chunk_size=FETCH_SIZE), 1):
+            try:
+                # Calculate moon phase for entry date
+                moon = phase_by_date.get(entry.entry_date)
+                if moon is None:
+                    moon = phase_by_date[entry.entry_date] = calculate_moon_phase(entry.entry_date)
+                phase, illumination = moon
+
+                # Update the analysis
+                entry.analysis.moon_phase = phase
+                entry.analysis.moon_illumination = illumination / 100.0  # Store as 0.0 to 1.0
+                pending.append(entry.analysis)
+
+                updated += 1
+
+                if i <= 10:  # Show details for first 10 only
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"  [{i}] {entry.entry_date} -> {phase} ({illumination:.1f}%)"
+                        )
+                    )
+                elif time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    self.stdout.write(f"  Processed {i} entries...")
+
+            except Exception as e:
+                errors.append((entry.id, str(e)))
+                self.stdout.write(
+                    self.style.ERROR(f"  [{i}] Error processing entry {entry.id}: {e}")
+                )
+
+            if len(pending) >= BATCH_SIZE:
+                self._flush(pending)
+                pending = []
+
+        self._flush(pending)
+        return updated, errors
+
+    def _backfill_in_database(self, entries):
+        """
+        Compute and store every pending moon phase in one set-based UPDATE.
+
+        Mirrors calculate_moon_phase in SQL (PostgreSQL only), so no rows are
+        shipped to Python.
+        """
+        entry_ids_sql, entry_ids_params = entries.order_by().values('id').query.sql_with_params()
+        phases = ', '.join(['%s'] * len(MOON_PHASES))
+        sql = f"""
+            UPDATE {EntryAnalysis._meta.db_table} AS a
+            SET moon_phase = (ARRAY[{phases}])[(c.cycle_seconds * 8 / %s)::int + 1],
+                moon_illumination = round(
+                    ((1 - cos(2 * pi() * c.cycle_seconds / %s)) / 2 * 100)::numeric, 1
+                ) / 100
+            FROM (
+                SELECT e.id AS entry_id,
+                       mod(mod(EXTRACT(EPOCH FROM e.entry_date + time '12:00' - %s::timestamp)::bigint, %s) + %s, %s)
+                           AS cycle_seconds
+                FROM {Entry._meta.db_table} AS e
+                WHERE e.id IN ({entry_ids_sql})
+            ) AS c
+            WHERE a.entry_id = c.entry_id AND a.moon_phase = ''
+        """
+        params = [
+            *MOON_PHASES,
+            SYNODIC_SECONDS,
+            SYNODIC_SECONDS,
+            KNOWN_NEW_MOON,
+            SYNODIC_SECONDS, SYNODIC_SECONDS, SYNODIC_SECONDS,
+            *entry_ids_params,
+        ]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--user',
@@ -99,19 +201,23 @@ class Command(BaseCommand):
         entries_with_analysis = entries.filter(analysis__isnull=False)
         entries_without_moon = entries_with_analysis.filter(
             analysis__moon_phase=''
-        ).select_related('analysis').order_by('entry_date')
-
-        total = entries_without_moon.count()
-
-        if total == 0:
-            self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have moon phase data!"))
-            return
-
-        self.stdout.write(f"Found {total} entries without moon phase data")
+        ).select_related('analysis').only(
+            # Skip the large text columns; only the date and the target fields are used
+            'id', 'title', 'entry_date',
+            'analysis__id', 'analysis__moon_phase', 'analysis__moon_illumination',
+        ).order_by('entry_date')
 
         if dry_run:
+            # One query fetches the preview; COUNT(*) only runs if there is more to report
+            preview = list(entries_without_moon[:21])
+            total = len(preview) if len(preview) <= 20 else entries_without_moon.count()
+            if total == 0:
+                self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have moon phase data!"))
+                return
+
+            self.stdout.write(f"Found {total} entries without moon phase data")
             self.stdout.write(self.style.WARNING("DRY RUN - no changes will be made"))
-            for entry in entries_without_moon[:20]:  # Show first 20 only
+            for entry in preview[:20]:  # Show first 20 only
                 phase, illumination = calculate_moon_phase(entry.entry_date)
                 self.stdout.write(
                     f"  {entry.entry_date} - {entry.title or 'Untitled'} -> {phase} ({illumination:.1f}% illumination)"
@@ -120,38 +226,17 @@ class Command(BaseCommand):
                 self.stdout.write(f"  ... and {total - 20} more")
             return
 
-        # Process entries
-        updated = 0
-        errors = []
-
-        with transaction.atomic():
-            for i, entry in enumerate(entries_without_moon, 1):
-                try:
-                    # Calculate moon phase for entry date
-                    phase, illumination = calculate_moon_phase(entry.entry_date)
-
-                    # Update the analysis
-                    entry.analysis.moon_phase = phase
-                    entry.analysis.moon_illumination = illumination / 100.0  # Store as 0.0 to 1.0
-                    entry.analysis.save(update_fields=['moon_phase', 'moon_illumination'])
-
-                    updated += 1
-
-                    if i % 100 == 0:
-                        self.stdout.write(f"  Processed {i}/{total} entries...")
-
-                    if i <= 10 or i % 500 == 0:  # Show details for first 10 and every 500th
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"  [{i}/{total}] {entry.entry_date} -> {phase} ({illumination:.1f}%)"
-                            )
-                        )
+        if connection.vendor == 'postgresql':
+            # Moon phase is a pure function of the date, so Postgres can
+            # compute and store all of them in a single UPDATE
+            updated = self._backfill_in_database(entries_without_moon)
+            errors = []
+        else:
+            updated, errors = self._backfill_in_python(entries_without_moon)
 
-                except Exception as e:
-                    errors.append((entry.id, str(e)))
-                    self.stdout.write(
-                        self.style.ERROR(f"  [{i}/{total}] Error processing entry {entry.id}: {e}")
-                    )
+        if updated == 0 and not errors:
+            self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have moon phase data!"))
+            return
 
         # Summary
         self.stdout.write("")
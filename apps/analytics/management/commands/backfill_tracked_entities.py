@@ -9,14 +9,27 @@ Usage:
     python manage.py backfill_tracked_entities --user=user@example.com
     python manage.py backfill_tracked_entities --type=book
 """
+import time
+from contextlib import nullcontext
+
 from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from apps.journal.models import EntryCapture
+from apps.analytics.models import TrackedBook, TrackedPerson
 from apps.analytics.services import (
     get_or_create_tracked_book,
     get_or_create_tracked_person,
 )
+from apps.analytics.services.book_matching import book_capture_link, normalize_text, refresh_capture_counts
+from apps.analytics.services.person_matching import normalize_name
+
+
+# Captures processed per transaction
+BATCH_SIZE = 500
+
+# Minimum seconds between progress lines in the processing loop
+PROGRESS_INTERVAL = 1.0
 
 
 class Command(BaseCommand):
@@ -61,12 +74,13 @@ class Command(BaseCommand):
 
         captures = captures.order_by('entry__entry_date')
 
-        total = captures.count()
-        self.stdout.write(f"Found {total} captures to process")
-
         if dry_run:
+            # One query fetches the preview; COUNT(*) only runs if there is more to report
+            preview = list(captures[:21])
+            total = len(preview) if len(preview) <= 20 else captures.count()
+            self.stdout.write(f"Found {total} captures to process")
             self.stdout.write(self.style.WARNING("DRY RUN - no changes will be made"))
-            for capture in captures[:20]:  # Show first 20 only
+            for capture in preview[:20]:  # Show first 20 only
                 self.stdout.write(
                     f"  [{capture.capture_type}] {capture.data.get('title') or capture.data.get('name')} "
                     f"(user: {capture.entry.user.email}, date: {capture.entry.entry_date})"
@@ -75,62 +89,160 @@ class Command(BaseCommand):
                 self.stdout.write(f"  ... and {total - 20} more")
             return
 
-        # Process captures
+        # Captures already linked to a book/person, and books/people that already
+        # have captures, are loaded up front instead of queried per capture
+        linked_to_book = set(
+            TrackedBook.captures.through.objects.values_list('entrycapture_id', flat=True)
+        )
+        linked_to_person = set(
+            TrackedPerson.captures.through.objects.values_list('entrycapture_id', flat=True)
+        )
+        known_book_ids = set(
+            TrackedBook.captures.through.objects.values_list('trackedbook_id', flat=True)
+        )
+        known_person_ids = set(
+            TrackedPerson.captures.through.objects.values_list('trackedperson_id', flat=True)
+        )
+
+        # Process captures, committing once per batch
         books_created = 0
         books_linked = 0
         people_created = 0
         people_linked = 0
         errors = []
 
-        for i, capture in enumerate(captures, 1):
-            try:
-                user = capture.entry.user
+        # Books/people already resolved in this run, keyed by owner and
+        # normalized name, so repeat captures skip the (fuzzy) match queries
+        book_by_key = {}
+        person_by_key = {}
 
-                if capture.capture_type == 'book':
-                    # Check if already linked
-                    if capture.tracked_book.exists():
-                        self.stdout.write(f"  [{i}/{total}] Book already linked: {capture.data.get('title')}")
-                        continue
+        capture_list = list(captures)
+        total = len(capture_list)
+        self.stdout.write(f"Found {total} captures to process")
+        last_progress = time.monotonic()
+        for batch_start in range(0, len(capture_list), BATCH_SIZE):
+            batch = capture_list[batch_start:batch_start + BATCH_SIZE]
 
+            # Run the batch without per-capture savepoints first. If any capture
+            # fails, the whole batch rolls back and is replayed with a savepoint
+            # around each capture, so only the failing ones are skipped.
+            for isolate in (False, True):
+                savepoint = transaction.atomic if isolate else nullcontext
+                undo = []
+                counts = (books_created, books_linked, people_created, people_linked)
+                # Book links are inserted together at the end of the batch
+                book_links = []
+                try:
                     with transaction.atomic():
-                        book = get_or_create_tracked_book(user, capture)
-                        if book:
-                            if book.captures.count() == 1:
-                                books_created += 1
-                                self.stdout.write(
-                                    self.style.SUCCESS(f"  [{i}/{total}] Created book: {book.title}")
-                                )
-                            else:
-                                books_linked += 1
-                                self.stdout.write(
-                                    f"  [{i}/{total}] Linked to existing book: {book.title}"
-                                )
+                        for i, capture in enumerate(batch, batch_start + 1):
+                            # Show details for first 10, then a periodic progress line
+                            verbose = i <= 10
+                            if not verbose and time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                                last_progress = time.monotonic()
+                                self.stdout.write(f"  Processed {i - 1}/{total} captures...")
 
-                elif capture.capture_type == 'person':
-                    # Check if already linked
-                    if capture.tracked_person.exists():
-                        self.stdout.write(f"  [{i}/{total}] Person already linked: {capture.data.get('name')}")
-                        continue
+                            key = None
+                            try:
+                                user = capture.entry.user
 
-                    with transaction.atomic():
-                        person = get_or_create_tracked_person(user, capture)
-                        if person:
-                            if person.captures.count() == 1:
-                                people_created += 1
-                                self.stdout.write(
-                                    self.style.SUCCESS(f"  [{i}/{total}] Created person: {person.name}")
-                                )
-                            else:
-                                people_linked += 1
+                                if capture.capture_type == 'book':
+                                    # Check if already linked
+                                    if capture.id in linked_to_book:
+                                        if verbose:
+                                            self.stdout.write(
+                                                f"  [{i}/{total}] Book already linked: {capture.data.get('title')}"
+                                            )
+                                        continue
+
+                                    key = (
+                                        'book',
+                                        user.id,
+                                        normalize_text(capture.data.get('title', '').strip()),
+                                        normalize_text(capture.data.get('author', '').strip()),
+                                    )
+
+                                    # Savepoint (on replay), so one failing capture doesn't abort the batch
+                                    with savepoint():
+                                        book = get_or_create_tracked_book(
+                                            user, capture, book_by_key.get(key), link=False
+                                        )
+                                    if book:
+                                        book_links.append(book_capture_link(book, capture))
+                                        book_by_key[key] = book
+                                        linked_to_book.add(capture.id)
+                                        undo.append((linked_to_book, capture.id))
+                                        if book.id not in known_book_ids:
+                                            known_book_ids.add(book.id)
+                                            undo.append((known_book_ids, book.id))
+                                            books_created += 1
+                                            if verbose:
+                                                self.stdout.write(
+                                                    self.style.SUCCESS(f"  [{i}/{total}] Created book: {book.title}")
+                                                )
+                                        else:
+                                            books_linked += 1
+                                            if verbose:
+                                                self.stdout.write(
+                                                    f"  [{i}/{total}] Linked to existing book: {book.title}"
+                                                )
+
+                                elif capture.capture_type == 'person':
+                                    # Check if already linked
+                                    if capture.id in linked_to_person:
+                                        if verbose:
+                                            self.stdout.write(
+                                                f"  [{i}/{total}] Person already linked: {capture.data.get('name')}"
+                                            )
+                                        continue
+
+                                    key = ('person', user.id, normalize_name(capture.data.get('name', '').strip()))
+
+                                    # Savepoint (on replay), so one failing capture doesn't abort the batch
+                                    with savepoint():
+                                        person = get_or_create_tracked_person(user, capture, person_by_key.get(key))
+                                    if person:
+                                        person_by_key[key] = person
+                                        linked_to_person.add(capture.id)
+                                        undo.append((linked_to_person, capture.id))
+                                        if person.id not in known_person_ids:
+                                            known_person_ids.add(person.id)
+                                            undo.append((known_person_ids, person.id))
+                                            people_created += 1
+                                            if verbose:
+                                                self.stdout.write(
+                                                    self.style.SUCCESS(f"  [{i}/{total}] Created person: {person.name}")
+                                                )
+                                        else:
+                                            people_linked += 1
+                                            if verbose:
+                                                self.stdout.write(
+                                                    f"  [{i}/{total}] Linked to existing person: {person.name}"
+                                                )
+
+                            except Exception as e:
+                                if not isolate:
+                                    raise
+                                # The savepoint rolled back, so the cached instance may be stale
+                                book_by_key.pop(key, None)
+                                person_by_key.pop(key, None)
+                                errors.append((capture.id, str(e)))
                                 self.stdout.write(
-                                    f"  [{i}/{total}] Linked to existing person: {person.name}"
+                                    self.style.ERROR(f"  [{i}/{total}] Error processing capture {capture.id}: {e}")
                                 )
 
-            except Exception as e:
-                errors.append((capture.id, str(e)))
-                self.stdout.write(
-                    self.style.ERROR(f"  [{i}/{total}] Error processing capture {capture.id}: {e}")
-                )
+                        TrackedBook.captures.through.objects.bulk_create(book_links, ignore_conflicts=True)
+                        if book_links:
+                            refresh_capture_counts({link.trackedbook_id for link in book_links})
+                    break
+                except Exception:
+                    if isolate:
+                        raise
+                    # Forget what the rolled-back pass recorded before replaying it
+                    for seen, value in undo:
+                        seen.discard(value)
+                    books_created, books_linked, people_created, people_linked = counts
+                    book_by_key.clear()
+                    person_by_key.clear()
 
         # Summary
         self.stdout.write("")
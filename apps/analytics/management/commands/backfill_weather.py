@@ -9,17 +9,128 @@ Usage:
     python manage.py backfill_weather --city="Boston" --country=US
     python manage.py backfill_weather --dry-run
 """
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
+
 from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.db import connection, transaction
 from django.contrib.auth.models import User
 
+from apps.accounts.models import Profile
 from apps.journal.models import Entry
 from apps.analytics.models import EntryAnalysis
+from apps.analytics.services.weather import (
+    WeatherRateLimited,
+    get_city_coordinates,
+    get_historical_weather,
+)
+
+
+# Rows fetched per round-trip, concurrent weather API requests, and
+# analyses written per bulk UPDATE
+FETCH_SIZE = 2000
+FETCH_WORKERS = 16
+BATCH_SIZE = 2000
+
+# Minimum seconds between progress lines in the processing loop
+PROGRESS_INTERVAL = 1.0
+
+# Weather/geocoding API calls started per second across all workers, and how
+# often a rate-limited (429) call is retried before it's reported as an error
+API_REQUESTS_PER_SECOND = 5
+RATE_LIMIT_RETRIES = 3
+
+WEATHER_FIELDS = [
+    'weather_location',
+    'weather_condition',
+    'weather_description',
+    'temperature',
+    'humidity',
+    'weather_icon',
+]
+
+
+class _RateLimiter:
+    """Spaces API calls evenly across threads; pause() holds everyone back after a 429."""
+
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            slot = max(self.next_slot, time.monotonic())
+            self.next_slot = slot + self.interval
+        delay = slot - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
 
 
 class Command(BaseCommand):
     help = 'Backfill weather data for existing entries'
 
+    @staticmethod
+    def _completed(futures):
+        """Yield (group, result, error) for each fetch as it finishes."""
+        for future in as_completed(futures):
+            try:
+                yield futures[future], future.result(), None
+            except Exception as e:
+                yield futures[future], None, e
+
+    def _call_api(self, limiter, func, *args, **kwargs):
+        """Call a weather API function under the rate limit, retrying 429s with backoff."""
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            limiter.wait()
+            try:
+                return func(*args, raise_on_rate_limit=True, **kwargs)
+            except WeatherRateLimited as e:
+                if attempt == RATE_LIMIT_RETRIES:
+                    raise
+                limiter.pause(e.retry_after or 2 ** attempt)
+
+    def _flush(self, analyses):
+        """Write a batch of weather results in a single transaction."""
+        if not analyses:
+            return
+        if connection.vendor == 'postgresql':
+            self._flush_via_copy(analyses)
+            return
+        with transaction.atomic():
+            EntryAnalysis.objects.bulk_update(analyses, WEATHER_FIELDS, batch_size=BATCH_SIZE)
+
+    def _flush_via_copy(self, analyses):
+        """
+        COPY a batch into a temp staging table, then apply it with one UPDATE ... FROM.
+
+        Avoids the per-row CASE WHEN expression that bulk_update builds, which
+        grows with the batch (PostgreSQL only).
+        """
+        table = EntryAnalysis._meta.db_table
+        columns = [EntryAnalysis._meta.get_field(field).column for field in WEATHER_FIELDS]
+        column_list = ', '.join(columns)
+        assignments = ', '.join(f"{column} = s.{column}" for column in columns)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Dropped at commit, so every batch starts from an empty table
+            cursor.execute(
+                f"CREATE TEMP TABLE _weather_stage ON COMMIT DROP AS "
+                f"SELECT id, {column_list} FROM {table} WITH NO DATA"
+            )
+            with cursor.copy(f"COPY _weather_stage (id, {column_list}) FROM STDIN") as copy:
+                for analysis in analyses:
+                    copy.write_row([analysis.pk, *(getattr(analysis, field) for field in WEATHER_FIELDS)])
+            cursor.execute(
+                f"UPDATE {table} AS a SET {assignments} FROM _weather_stage AS s WHERE a.id = s.id"
+            )
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--user',
@@ -49,9 +160,6 @@ class Command(BaseCommand):
         )
 
     def handle(self, *args, **options):
-        # Import weather service functions
-        from apps.analytics.services.weather import get_historical_weather
-
         user_email = options.get('user')
         override_city = options.get('city')
         override_country = options.get('country')
@@ -62,7 +170,11 @@ class Command(BaseCommand):
         entries_without_weather = Entry.objects.filter(
             is_analyzed=True,
             analysis__weather_location=''
-        ).select_related('user__profile', 'analysis')
+        ).select_related('analysis').only(
+            # Skip the large text columns; only the location, date and target fields are used
+            'id', 'user', 'title', 'entry_date', 'city', 'country_code',
+            'analysis__id', *(f'analysis__{field}' for field in WEATHER_FIELDS),
+        )
 
         if user_email:
             try:
@@ -72,22 +184,33 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f"User with email {user_email} not found"))
                 return
 
+        # Profile locations, loaded once per user instead of joined onto every entry
+        profile_locations = {}
+        if not override_city:
+            profile_locations = {
+                user_id: (city, country_code or 'US')
+                for user_id, city, country_code in Profile.objects.filter(
+                    user_id__in=entries_without_weather.values('user_id'),
+                ).exclude(city='').values_list('user_id', 'city', 'country_code')
+            }
+
         if limit:
             entries_without_weather = entries_without_weather[:limit]
 
-        total = entries_without_weather.count()
-
-        if total == 0:
-            self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have weather data!"))
-            return
-
-        self.stdout.write(f"Found {total} entries without weather data")
-
         if dry_run:
+            # One query fetches the preview; COUNT(*) only runs if there is more to report
+            preview = list(entries_without_weather[:21])
+            total = len(preview) if len(preview) <= 20 else entries_without_weather.count()
+            if total == 0:
+                self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have weather data!"))
+                return
+
+            self.stdout.write(f"Found {total} entries without weather data")
             self.stdout.write(self.style.WARNING("DRY RUN - no changes will be made"))
-            for entry in entries_without_weather[:20]:  # Show first 20 only
-                city = override_city or entry.city or (entry.user.profile.city if hasattr(entry.user, 'profile') else '')
-                country = override_country or entry.country_code or (entry.user.profile.country_code if hasattr(entry.user, 'profile') else 'US')
+            for entry in preview[:20]:  # Show first 20 only
+                profile_city, profile_country = profile_locations.get(entry.user_id, ('', 'US'))
+                city = override_city or entry.city or profile_city
+                country = override_country or entry.country_code or profile_country
                 self.stdout.write(
                     f"  {entry.entry_date} - {entry.title or 'Untitled'} -> Would fetch weather for {city}, {country}"
                 )
@@ -95,74 +218,126 @@ class Command(BaseCommand):
                 self.stdout.write(f"  ... and {total - 20} more")
             return
 
-        # Process entries
+        # Resolve each entry's location first, then fetch weather concurrently
         updated = 0
         skipped = 0
         errors = []
+        # Entries grouped by (city, country, date): each distinct lookup is fetched once
+        jobs = {}
+        # No up-front COUNT(*): the total is known once this pass has run
+        total = 0
 
-        for i, entry in enumerate(entries_without_weather, 1):
-            try:
-                # Determine location
-                if override_city:
-                    city = override_city
-                    country_code = override_country
+        for i, entry in enumerate(entries_without_weather.iterator(chunk_size=FETCH_SIZE), 1):
+            total = i
+
+            # Determine location
+            if override_city:
+                city = override_city
+                country_code = override_country
+            else:
+                # Use entry location if available, otherwise profile location
+                city = entry.city
+                country_code = entry.country_code
+
+                if not city and entry.user_id in profile_locations:
+                    city, country_code = profile_locations[entry.user_id]
+
+            if not city:
+                skipped += 1
+                if i <= 10:
+                    self.stdout.write(f"  [{i}] Skipped (no location): {entry.entry_date}")
+                continue
+
+            key = (city.lower(), (country_code or '').upper(), entry.entry_date)
+            jobs.setdefault(key, []).append((i, entry, city, country_code))
+
+        if total == 0:
+            self.stdout.write(self.style.SUCCESS("✓ All analyzed entries already have weather data!"))
+            return
+
+        self.stdout.write(f"Found {total} entries without weather data")
+
+        pending = []
+        last_progress = time.monotonic()
+
+        limiter = _RateLimiter(API_REQUESTS_PER_SECOND)
+
+        # Each fetch blocks on HTTP, so run them on a bounded thread pool
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            # Geocode each distinct location once, not once per date
+            locations = {}
+            for (city_key, country_key, _), group in jobs.items():
+                _, _, city, country_code = group[0]
+                locations.setdefault((city_key, country_key), (city, country_code))
+            coords_futures = {
+                executor.submit(self._call_api, limiter, get_city_coordinates, city, country_code): location
+                for location, (city, country_code) in locations.items()
+            }
+            coordinates = {}
+            for future in as_completed(coords_futures):
+                try:
+                    coordinates[coords_futures[future]] = future.result()
+                except Exception as e:
+                    coordinates[coords_futures[future]] = e
+
+            futures = {}
+            # (group, weather_data, fetch_error) for locations that failed to geocode
+            unfetched = []
+            for (city_key, country_key, _), group in jobs.items():
+                _, entry, city, country_code = group[0]
+                coords = coordinates[(city_key, country_key)]
+                if isinstance(coords, Exception):
+                    unfetched.append((group, None, coords))
+                elif not coords:
+                    unfetched.append((group, None, None))
                 else:
-                    # Use entry location if available, otherwise profile location
-                    city = entry.city
-                    country_code = entry.country_code
-
-                    if not city and hasattr(entry.user, 'profile'):
-                        city = entry.user.profile.city
-                        country_code = entry.user.profile.country_code or 'US'
-
-                if not city:
-                    skipped += 1
-                    if i <= 10:
-                        self.stdout.write(f"  [{i}/{total}] Skipped (no location): {entry.entry_date}")
-                    continue
-
-                # Fetch HISTORICAL weather for the entry's date
-                weather_data = get_historical_weather(city, entry.entry_date, country_code)
-
-                if not weather_data:
-                    skipped += 1
-                    if i <= 10:
-                        self.stdout.write(f"  [{i}/{total}] Skipped (no weather data): {entry.entry_date}")
-                    continue
-
-                # Update analysis
-                entry.analysis.weather_location = f"{city}, {country_code}"
-                entry.analysis.weather_condition = weather_data.get('condition', '')
-                entry.analysis.weather_description = weather_data.get('description', '')
-                entry.analysis.temperature = weather_data.get('temperature')
-                entry.analysis.humidity = weather_data.get('humidity')
-                entry.analysis.weather_icon = weather_data.get('icon_code', '')
-                entry.analysis.save(update_fields=[
-                    'weather_location',
-                    'weather_condition',
-                    'weather_description',
-                    'temperature',
-                    'humidity',
-                    'weather_icon'
-                ])
-
-                updated += 1
-
-                if i % 100 == 0:
-                    self.stdout.write(f"  Processed {i}/{total} entries...")
-
-                if i <= 10 or i % 500 == 0:  # Show details for first 10 and every 500th
-                    self.stdout.write(
-                        self.style.SUCCESS(
-                            f"  [{i}/{total}] {entry.entry_date} -> {weather_data.get('condition')} in {city}"
+                    # HISTORICAL weather for the entries' date
+                    futures[executor.submit(
+                        self._call_api, limiter, get_historical_weather,
+                        city, entry.entry_date, country_code, coords=coords,
+                    )] = group
+
+            for group, weather_data, fetch_error in chain(unfetched, self._completed(futures)):
+                for i, entry, city, country_code in group:
+                    if fetch_error is not None:
+                        errors.append((entry.id, str(fetch_error)))
+                        self.stdout.write(
+                            self.style.ERROR(f"  [{i}/{total}] Error processing entry {entry.id}: {fetch_error}")
                         )
-                    )
+                        continue
 
-            except Exception as e:
-                errors.append((entry.id, str(e)))
-                self.stdout.write(
-                    self.style.ERROR(f"  [{i}/{total}] Error processing entry {entry.id}: {e}")
-                )
+                    if not weather_data:
+                        skipped += 1
+                        if i <= 10:
+                            self.stdout.write(f"  [{i}/{total}] Skipped (no weather data): {entry.entry_date}")
+                        continue
+
+                    # Update analysis
+                    entry.analysis.weather_location = f"{city}, {country_code}"
+                    entry.analysis.weather_condition = weather_data.get('condition', '')
+                    entry.analysis.weather_description = weather_data.get('description', '')
+                    entry.analysis.temperature = weather_data.get('temperature')
+                    entry.analysis.humidity = weather_data.get('humidity')
+                    entry.analysis.weather_icon = weather_data.get('icon_code', '')
+                    pending.append(entry.analysis)
+
+                    updated += 1
+
+                    if i <= 10:  # Show details for first 10 only
+                        self.stdout.write(
+                            self.style.SUCCESS(
+                                f"  [{i}/{total}] {entry.entry_date} -> {weather_data.get('condition')} in {city}"
+                            )
+                        )
+                    elif time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                        last_progress = time.monotonic()
+                        self.stdout.write(f"  Processed {updated}/{total} entries...")
+
+                if len(pending) >= BATCH_SIZE:
+                    self._flush(pending)
+                    pending = []
+
+        self._flush(pending)
 
         # Summary
         self.stdout.write("")
@@ -5,17 +5,64 @@ Usage:
     python manage.py reanalyze_moods           # All entries
     python manage.py reanalyze_moods --user 1  # Specific user
     python manage.py reanalyze_moods --dry-run # Preview changes
+    python manage.py reanalyze_moods --workers 4  # Score on 4 processes
 """
+import multiprocessing
+import os
+import time
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
+from django.db import connections, transaction
 from apps.journal.models import Entry
 from apps.analytics.models import EntryAnalysis
 from apps.analytics.services import get_sentiment_score, classify_mood
 
 
+# Rows fetched per round-trip, and changed analyses written per bulk UPDATE
+FETCH_SIZE = 2000
+BATCH_SIZE = 5000
+
+# Minimum seconds between progress lines in the processing loop
+PROGRESS_INTERVAL = 1.0
+
+
+def _score_content(content):
+    """Score one entry's text. Runs in a worker process, so it must not touch the DB."""
+    sentiment = get_sentiment_score(content)
+    mood, confidence, _ = classify_mood(content, sentiment)
+    return sentiment, mood, confidence
+
+
 class Command(BaseCommand):
     help = 'Re-analyze mood for all entries using VADER sentiment'
 
+    def _flush(self, analyses):
+        """Write a batch of re-analyzed moods in a single transaction."""
+        if not analyses:
+            return
+        with transaction.atomic():
+            EntryAnalysis.objects.bulk_update(
+                analyses,
+                ['sentiment_score', 'detected_mood', 'mood_confidence'],
+                batch_size=BATCH_SIZE,
+            )
+
+    def _scoreable_chunks(self, queryset):
+        """Yield lists of (analysis, content) pairs for entries with readable content."""
+        chunk = []
+        for analysis in queryset.iterator(chunk_size=FETCH_SIZE):
+            content = analysis.entry.content
+            if not content or content.startswith('gAAAAA'):
+                # Skip encrypted entries without available key
+                continue
+            chunk.append((analysis, content))
+            if len(chunk) >= FETCH_SIZE:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--user',
@@ -27,10 +74,16 @@ class Command(BaseCommand):
             action='store_true',
             help='Preview changes without saving',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Processes used for sentiment scoring (default: CPU count, 1 disables)',
+        )
 
     def handle(self, *args, **options):
         user_id = options.get('user')
         dry_run = options.get('dry_run')
+        workers = options.get('workers') or os.cpu_count() or 1
 
         # Get entries with analysis
         queryset = EntryAnalysis.objects.select_related('entry', 'entry__user')
@@ -41,41 +94,64 @@ class Command(BaseCommand):
         else:
             self.stdout.write("Re-analyzing entries for all users...")
 
-        total = queryset.count()
         updated = 0
         changed = 0
-
-        for analysis in queryset.iterator():
-            entry = analysis.entry
-            old_mood = analysis.detected_mood
-            old_sentiment = analysis.sentiment_score
-
-            # Re-calculate sentiment and mood
-            content = entry.content
-            if not content or content.startswith('gAAAAA'):
-                # Skip encrypted entries without available key
-                continue
-
-            new_sentiment = get_sentiment_score(content)
-            new_mood, confidence, _ = classify_mood(content, new_sentiment)
-
-            updated += 1
-
-            if old_mood != new_mood:
-                changed += 1
-                self.stdout.write(
-                    f"  Entry {entry.id}: {old_mood} -> {new_mood} "
-                    f"(sentiment: {old_sentiment:.2f} -> {new_sentiment:.2f})"
-                )
-
-                if not dry_run:
-                    analysis.sentiment_score = new_sentiment
-                    analysis.detected_mood = new_mood
-                    analysis.mood_confidence = confidence
-                    analysis.save(update_fields=['sentiment_score', 'detected_mood', 'mood_confidence'])
-
-            if updated % 100 == 0:
-                self.stdout.write(f"  Processed {updated}/{total}...")
+        pending = []
+        last_progress = time.monotonic()
+
+        # VADER scoring is CPU-bound, so spread it over a process pool while
+        # reads and writes stay on this process. Workers are forked before the
+        # first query so none of them inherits an open DB connection.
+        pool = None
+        if workers > 1:
+            # Load VADER's lexicon here so every forked worker inherits it
+            get_sentiment_score('warm up')
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(workers)
+
+        try:
+            for chunk in self._scoreable_chunks(queryset):
+                contents = [content for _, content in chunk]
+                if pool is not None:
+                    results = pool.map(
+                        _score_content, contents, chunksize=max(1, len(contents) // (workers * 4))
+                    )
+                else:
+                    results = map(_score_content, contents)
+
+                for (analysis, _), (new_sentiment, new_mood, confidence) in zip(chunk, results):
+                    old_mood = analysis.detected_mood
+                    old_sentiment = analysis.sentiment_score
+
+                    updated += 1
+
+                    if old_mood != new_mood:
+                        changed += 1
+                        self.stdout.write(
+                            f"  Entry {analysis.entry_id}: {old_mood} -> {new_mood} "
+                            f"(sentiment: {old_sentiment:.2f} -> {new_sentiment:.2f})"
+                        )
+
+                        if not dry_run:
+                            analysis.sentiment_score = new_sentiment
+                            analysis.detected_mood = new_mood
+                            analysis.mood_confidence = confidence
+                            pending.append(analysis)
+
+                            if len(pending) >= BATCH_SIZE:
+                                self._flush(pending)
+                                pending = []
+
+                if time.monotonic() - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = time.monotonic()
+                    self.stdout.write(f"  Processed {updated}...")
+        finally:
+            # Every map() call has returned by now, so nothing is left to drain
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        self._flush(pending)
 
         if dry_run:
             self.stdout.write(self.style.WARNING(
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-16 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("analytics", "0006_add_theme_entry_counts"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="entryanalysis",
+            index=models.Index(
+                condition=models.Q(("moon_phase", "")),
+                fields=["entry"],
+                name="analysis_missing_moon_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="entryanalysis",
+            index=models.Index(
+                condition=models.Q(("weather_location", "")),
+                fields=["entry"],
+                name="analysis_missing_weather_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.9 on 2026-10-16 15:40
+
+from django.db import migrations
+
+INDEX_NAME = "analytics_book_title_trgm_idx"
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm and GIN trigram indexes are PostgreSQL-only; SQLite dev databases skip this
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    table = apps.get_model("analytics", "TrackedBook")._meta.db_table
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON {table} "
+        f"USING gin (normalized_title gin_trgm_ops)"
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("analytics", "0007_entryanalysis_missing_backfill_idx"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
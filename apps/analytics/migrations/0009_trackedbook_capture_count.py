@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-16 16:05
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_capture_counts(apps, schema_editor):
+    TrackedBook = apps.get_model("analytics", "TrackedBook")
+    books = list(
+        TrackedBook.objects.annotate(n=Count("captures")).filter(n__gt=0).only("id")
+    )
+    for book in books:
+        book.capture_count = book.n
+    TrackedBook.objects.bulk_update(books, ["capture_count"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("analytics", "0008_trackedbook_title_trigram_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trackedbook",
+            name="capture_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_capture_counts, migrations.RunPython.noop),
+    ]
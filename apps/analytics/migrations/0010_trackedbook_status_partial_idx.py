@@ -0,0 +1,28 @@
+# Generated by Django 5.2.9 on 2026-10-16 16:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("analytics", "0009_trackedbook_capture_count"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="trackedbook",
+            index=models.Index(
+                condition=models.Q(("status", "reading")),
+                fields=["user", "-updated_at"],
+                name="idx_tb_reading",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="trackedbook",
+            index=models.Index(
+                condition=models.Q(("status", "want_to_read")),
+                fields=["user", "-updated_at"],
+                name="idx_tb_want_to_read",
+            ),
+        ),
+    ]
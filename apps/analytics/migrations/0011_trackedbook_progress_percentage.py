@@ -0,0 +1,30 @@
+# Generated by Django 5.2.9 on 2026-10-16 16:40
+
+from django.db import migrations, models
+
+
+def backfill_progress(apps, schema_editor):
+    TrackedBook = apps.get_model("analytics", "TrackedBook")
+    books = list(
+        TrackedBook.objects.filter(total_pages__gt=0, current_page__gt=0).only(
+            "id", "current_page", "total_pages"
+        )
+    )
+    for book in books:
+        book.progress_percentage = min(100, int((book.current_page / book.total_pages) * 100))
+    TrackedBook.objects.bulk_update(books, ["progress_percentage"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("analytics", "0010_trackedbook_status_partial_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trackedbook",
+            name="progress_percentage",
+            field=models.PositiveSmallIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(backfill_progress, migrations.RunPython.noop),
+    ]
@@ -2,6 +2,12 @@ from django.db import models
 from django.contrib.auth.models import User
 from apps.journal.models import Entry
 
+# Indexed by month number (1-12), like calendar.month_name
+_MONTH_NAMES = (
+    '', 'January', 'February', 'March', 'April', 'May', 'June',
+    'July', 'August', 'September', 'October', 'November', 'December',
+)
+
 
 class EntryAnalysis(models.Model):
     """
@@ -105,6 +111,20 @@ class EntryAnalysis(models.Model):
     class Meta:
         verbose_name = 'Entry Analysis'
         verbose_name_plural = 'Entry Analyses'
+        indexes = [
+            # Partial indexes covering only rows the backfill commands still
+            # need to process, so finding them doesn't scan the whole table
+            models.Index(
+                fields=['entry'],
+                condition=models.Q(moon_phase=''),
+                name='analysis_missing_moon_idx',
+            ),
+            models.Index(
+                fields=['entry'],
+                condition=models.Q(weather_location=''),
+                name='analysis_missing_weather_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Analysis for Entry {self.entry.id}"
@@ -159,8 +179,7 @@ class MonthlySnapshot(models.Model):
 
     @property
     def month_name(self):
-        import calendar
-        return calendar.month_name[self.month]
+        return _MONTH_NAMES[self.month]
 
 
 class YearlyReview(models.Model):
@@ -282,6 +301,8 @@ class TrackedBook(models.Model):
     # Progress tracking
     current_page = models.IntegerField(default=0)
     total_pages = models.IntegerField(null=True, blank=True)
+    # Derived from current_page/total_pages in save(), stored so lists can sort by it
+    progress_percentage = models.PositiveSmallIntegerField(default=0, db_index=True)
 
     # Rating (1-5 stars)
     rating = models.IntegerField(null=True, blank=True)
@@ -292,6 +313,9 @@ class TrackedBook(models.Model):
         related_name='tracked_book',
         blank=True
     )
+    # Denormalized captures.count(): incremented when a capture is linked,
+    # decremented by the EntryCapture pre_delete receiver in journal.signals
+    capture_count = models.IntegerField(default=0)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -301,16 +325,36 @@ class TrackedBook(models.Model):
         indexes = [
             models.Index(fields=['user', 'status']),
             models.Index(fields=['user', 'finished_date']),
+            # Small partial indexes for the "currently reading" / "want to read" widgets,
+            # in the model's default -updated_at order
+            models.Index(
+                fields=['user', '-updated_at'],
+                name='idx_tb_reading',
+                condition=models.Q(status='reading'),
+            ),
+            models.Index(
+                fields=['user', '-updated_at'],
+                name='idx_tb_want_to_read',
+                condition=models.Q(status='want_to_read'),
+            ),
         ]
         ordering = ['-updated_at']
 
     def __str__(self):
         return f"{self.title} by {self.author or 'Unknown'}"
 
-    @property
-    def progress_percentage(self):
+    def save(self, *args, **kwargs):
+        # Keep progress_percentage in sync whenever the page counts may have changed
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'current_page', 'total_pages'} & set(update_fields):
+            self.progress_percentage = self.build_progress_percentage()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'progress_percentage'}
+        super().save(*args, **kwargs)
+
+    def build_progress_percentage(self):
         if self.total_pages and self.total_pages > 0:
-            return min(100, int((self.current_page / self.total_pages) * 100))
+            return max(0, min(100, int((self.current_page / self.total_pages) * 100)))
         return 0
 
     @property
@@ -417,18 +461,17 @@ class TrackedPerson(models.Model):
 
     def update_stats(self):
         """Recalculate denormalized stats from captures."""
-        captures = self.captures.all().select_related('entry')
-        self.mention_count = captures.count()
-
-        if captures.exists():
-            dates = [c.entry.entry_date for c in captures]
-            self.first_mention_date = min(dates)
-            self.last_mention_date = max(dates)
-        else:
-            self.first_mention_date = None
-            self.last_mention_date = None
-
-        self.save()
+        # One aggregate query instead of loading every capture and its entry
+        stats = self.captures.aggregate(
+            count=models.Count('id'),
+            first=models.Min('entry__entry_date'),
+            last=models.Max('entry__entry_date'),
+        )
+        self.mention_count = stats['count']
+        self.first_mention_date = stats['first']
+        self.last_mention_date = stats['last']
+
+        self.save(update_fields=['mention_count', 'first_mention_date', 'last_mention_date', 'updated_at'])
 
 
 class CaptureSnapshot(models.Model):
@@ -6,13 +6,43 @@ multiple /book captures, enabling progress tracking over time.
 """
 import re
 import logging
+from functools import lru_cache
+
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+try:
+    from rapidfuzz import fuzz, process
+    _HAS_RAPIDFUZZ = True
+except ImportError:
+    fuzz = process = None
+    _HAS_RAPIDFUZZ = False
 
 logger = logging.getLogger(__name__)
 
 # Threshold for fuzzy matching (0-100)
 FUZZY_MATCH_THRESHOLD = 85
 
+# Seconds a user's match candidates stay cached
+BOOK_INDEX_CACHE_TIMEOUT = 60
+
+# Libraries larger than this aren't cached; on PostgreSQL a trigram index
+# shortlists their candidates instead
+BOOK_INDEX_MAX_SIZE = 1000
+BOOK_TRIGRAM_SHORTLIST_SIZE = 50
+
+_PUNCTUATION_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
 
+# str.translate table deleting what _PUNCTUATION_RE strips from ASCII text
+_ASCII_PUNCTUATION = dict.fromkeys(
+    code for code in range(128)
+    if not (chr(code).isalnum() or chr(code).isspace() or chr(code) == '_')
+)
+
+
+@lru_cache(maxsize=4096)
 def normalize_text(text):
     """
     Normalize text for comparison.
@@ -20,13 +50,85 @@ def normalize_text(text):
     - Lowercase
     - Strip punctuation
     - Collapse whitespace
+
+    Memoized: repeat captures of the same title skip the work.
     """
     if not text:
         return ''
-    text = text.lower().strip()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text
+    if not text.isascii():
+        text = _PUNCTUATION_RE.sub('', text.lower().strip())
+        return _WHITESPACE_RE.sub(' ', text)
+
+    # ASCII fast path: table lookups instead of the regex engine. Stripping
+    # happens before punctuation removal, so an edge space can survive (as
+    # with the regex path) and is kept to match stored normalized titles.
+    text = text.lower().strip().translate(_ASCII_PUNCTUATION)
+    words = text.split()
+    if not words:
+        return ' ' if text else ''
+    normalized = ' '.join(words)
+    if text[0].isspace():
+        normalized = ' ' + normalized
+    if text[-1].isspace():
+        normalized += ' '
+    return normalized
+
+
+def _book_index_key(user_id):
+    return f"tracked_books:{user_id}"
+
+
+def forget_book_index(user_id):
+    """Drop the cached match candidates for a user (call after a book is added, renamed or deleted)."""
+    cache.delete(_book_index_key(user_id))
+
+
+def _book_index(user_id):
+    """
+    Return (pk, normalized_title, normalized_author) for each of a user's books.
+
+    Cached briefly so a burst of /book captures doesn't re-read every book
+    for each fuzzy match. Returns None for libraries over BOOK_INDEX_MAX_SIZE.
+    """
+    from apps.analytics.models import TrackedBook
+
+    cache_key = _book_index_key(user_id)
+    index = cache.get(cache_key)
+    if index is None:
+        # Only the columns used for scoring; the winner is loaded in full later
+        index = list(
+            TrackedBook.objects.filter(user_id=user_id).values_list(
+                'id', 'normalized_title', 'normalized_author'
+            )[:BOOK_INDEX_MAX_SIZE + 1]
+        )
+        if len(index) > BOOK_INDEX_MAX_SIZE:
+            index = False  # cached marker: too large, don't re-read it each time
+        cache.set(cache_key, index, BOOK_INDEX_CACHE_TIMEOUT)
+    return None if index is False else index
+
+
+def _trigram_shortlist(user_id, normalized_title):
+    """
+    Return candidates whose title shares enough trigrams with normalized_title.
+
+    Uses pg_trgm's % operator, which the trigram GIN index on
+    normalized_title serves (PostgreSQL only).
+    """
+    from django.contrib.postgres.lookups import TrigramSimilar
+    from django.contrib.postgres.search import TrigramSimilarity
+
+    from apps.analytics.models import TrackedBook
+
+    return list(
+        TrackedBook.objects.filter(
+            TrigramSimilar(F('normalized_title'), normalized_title),
+            user_id=user_id,
+        ).annotate(
+            similarity=TrigramSimilarity('normalized_title', normalized_title),
+        ).order_by('-similarity').values_list(
+            'id', 'normalized_title', 'normalized_author'
+        )[:BOOK_TRIGRAM_SHORTLIST_SIZE]
+    )
 
 
 def find_matching_book(user, title, author=None):
@@ -57,43 +159,98 @@ def find_matching_book(user, title, author=None):
     if normalized_author:
         exact_query = exact_query.filter(normalized_author=normalized_author)
 
-    if exact_query.exists():
-        return exact_query.first(), 100
+    exact = exact_query.first()
+    if exact:
+        return exact, 100
 
     # Fuzzy match against all user's books
-    try:
-        from rapidfuzz import fuzz
-    except ImportError:
+    if not _HAS_RAPIDFUZZ:
         logger.warning("rapidfuzz not installed, falling back to exact match only")
         return None, 0
 
-    candidates = TrackedBook.objects.filter(user=user)
-    best_match = None
-    best_score = 0
-
-    for book in candidates:
-        # Title similarity is weighted most heavily
-        title_score = fuzz.ratio(normalized_title, book.normalized_title)
-
-        # If both have authors, factor that in
-        if normalized_author and book.normalized_author:
-            author_score = fuzz.ratio(normalized_author, book.normalized_author)
-            # 70% title, 30% author
-            score = (title_score * 0.7) + (author_score * 0.3)
+    titles = {}
+    authors = {}
+    candidates = _book_index(user.id)
+    if candidates is None:
+        if connection.vendor == 'postgresql':
+            candidates = _trigram_shortlist(user.id, normalized_title)
         else:
-            score = title_score
+            # Scanned once, so stream it rather than filling the result cache
+            candidates = TrackedBook.objects.filter(user=user).values_list(
+                'id', 'normalized_title', 'normalized_author'
+            ).iterator(chunk_size=500)
+    for pk, book_title, book_author in candidates:
+        titles[pk] = book_title
+        authors[pk] = book_author
+
+    best_pk = None
+    best_score = 0
 
-        if score > best_score:
-            best_score = score
-            best_match = book
+    if not normalized_author:
+        # Title only: rapidfuzz scans every candidate in C. With a score_cutoff
+        # it skips titles whose length difference alone rules them out, and
+        # stops each comparison once the cutoff is unreachable
+        match = process.extractOne(
+            normalized_title, titles, scorer=fuzz.ratio, score_cutoff=FUZZY_MATCH_THRESHOLD
+        )
+        if match:
+            _, best_score, best_pk = match
+    else:
+        # A 70/30 blend can't reach the threshold unless the title alone scores
+        # at least this, so only that shortlist needs an author comparison
+        title_cutoff = (FUZZY_MATCH_THRESHOLD - 30) / 0.7
+        shortlist = process.extract(
+            normalized_title, titles, scorer=fuzz.ratio, score_cutoff=title_cutoff, limit=None
+        )
+        for _, title_score, pk in shortlist:
+            # If both have authors, factor that in
+            if authors[pk]:
+                author_score = fuzz.ratio(normalized_author, authors[pk])
+                # 70% title, 30% author
+                score = (title_score * 0.7) + (author_score * 0.3)
+            else:
+                score = title_score
+
+            if score > best_score:
+                best_score = score
+                best_pk = pk
 
     if best_score >= FUZZY_MATCH_THRESHOLD:
-        return best_match, best_score
+        book = TrackedBook.objects.filter(pk=best_pk).first()
+        if book:
+            return book, best_score
+        # Deleted since the index was cached
+        forget_book_index(user.id)
+        return None, 0
 
     return None, best_score
 
 
-def get_or_create_tracked_book(user, capture):
+def book_capture_link(book, capture):
+    """Build an unsaved book/capture through row, for bulk_create(ignore_conflicts=True)."""
+    from apps.analytics.models import TrackedBook
+
+    return TrackedBook.captures.through(trackedbook_id=book.id, entrycapture_id=capture.id)
+
+
+def refresh_capture_counts(book_ids):
+    """Recount capture_count for the given books in one UPDATE, after bulk-inserted links."""
+    from django.db.models import Count, OuterRef, Subquery
+    from django.db.models.functions import Coalesce
+
+    from apps.analytics.models import TrackedBook
+
+    through = TrackedBook.captures.through
+    counts = (
+        through.objects.filter(trackedbook_id=OuterRef('pk'))
+        .values('trackedbook_id')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    TrackedBook.objects.filter(pk__in=book_ids).update(capture_count=Coalesce(Subquery(counts), 0))
+
+
+def get_or_create_tracked_book(user, capture, book=None, link=True):
     """
     Get or create a TrackedBook from an EntryCapture.
 
@@ -102,6 +259,10 @@ def get_or_create_tracked_book(user, capture):
     Args:
         user: The user who owns the capture
         capture: An EntryCapture with capture_type='book'
+        book: Optional TrackedBook the caller already matched this capture
+            to; skips the lookup
+        link: Add the capture to book.captures here. Pass False when the
+            caller inserts many links at once (see book_capture_link)
 
     Returns:
         TrackedBook or None if capture has no title
@@ -116,51 +277,76 @@ def get_or_create_tracked_book(user, capture):
         logger.warning(f"Book capture {capture.id} has no title")
         return None
 
-    # Find or create the book
-    existing_book, confidence = find_matching_book(user, title, author)
-
-    if existing_book:
-        book = existing_book
-        logger.info(f"Matched book capture to existing: {book.title} (confidence: {confidence}%)")
-    else:
-        # Create new book
-        book = TrackedBook.objects.create(
-            user=user,
-            title=title,
-            normalized_title=normalize_text(title),
-            author=author,
-            normalized_author=normalize_text(author),
-        )
-        logger.info(f"Created new TrackedBook: {book.title}")
-
-    # Link this capture to the book
-    book.captures.add(capture)
+    # Find or create the book, unless the caller already resolved it
+    if book is None:
+        existing_book, confidence = find_matching_book(user, title, author)
 
-    # Update book from capture data
+        if existing_book:
+            book = existing_book
+            logger.info(f"Matched book capture to existing: {book.title} (confidence: {confidence}%)")
+        else:
+            # Create new book. A concurrent capture of the same book can win the
+            # race to insert it; the savepoint lets us re-read its row instead
+            normalized_title = normalize_text(title)
+            normalized_author = normalize_text(author)
+            try:
+                with transaction.atomic():
+                    book = TrackedBook.objects.create(
+                        user=user,
+                        title=title,
+                        normalized_title=normalized_title,
+                        author=author,
+                        normalized_author=normalized_author,
+                    )
+            except IntegrityError:
+                book = TrackedBook.objects.get(
+                    user=user,
+                    normalized_title=normalized_title,
+                    normalized_author=normalized_author,
+                )
+                logger.info(f"TrackedBook created concurrently, reusing: {book.title}")
+            else:
+                logger.info(f"Created new TrackedBook: {book.title}")
+            forget_book_index(user.id)
+
+    # Link this capture to the book, counting it only the first time
+    if link and not book.captures.filter(pk=capture.pk).exists():
+        book.captures.add(capture)
+        TrackedBook.objects.filter(pk=book.pk).update(capture_count=F('capture_count') + 1)
+
+    # Update book from capture data, tracking which fields change
+    dirty = set()
     status = data.get('status', '').lower()
     entry_date = capture.entry.entry_date
 
     # Handle status transitions
     if status == 'finished':
         book.status = 'finished'
+        dirty.add('status')
         # Only update finished_date if not already set or this is later
         if not book.finished_date or entry_date > book.finished_date:
             book.finished_date = entry_date
+            dirty.add('finished_date')
         # Update rating if provided
         if data.get('rating'):
             book.rating = int(data['rating'])
+            dirty.add('rating')
     elif status in ['started', 'reading']:
         # Only change to reading if not already finished
         if book.status != 'finished':
             book.status = 'reading'
+            dirty.add('status')
         # Set started_date if not set
         if not book.started_date:
             book.started_date = entry_date
+            dirty.add('started_date')
     elif status == 'abandoned':
         book.status = 'abandoned'
+        dirty.add('status')
     elif status == 'want_to_read':
         if book.status not in ['reading', 'finished']:
             book.status = 'want_to_read'
+            dirty.add('status')
 
     # Update page progress
     page = data.get('page')
@@ -169,6 +355,7 @@ def get_or_create_tracked_book(user, capture):
             page_num = int(page)
             if page_num > book.current_page:
                 book.current_page = page_num
+                dirty.add('current_page')
         except (ValueError, TypeError):
             pass
 
@@ -177,8 +364,10 @@ def get_or_create_tracked_book(user, capture):
     if total_pages and not book.total_pages:
         try:
             book.total_pages = int(total_pages)
+            dirty.add('total_pages')
         except (ValueError, TypeError):
             pass
 
-    book.save()
+    # Bump updated_at even when nothing else changed: books are listed most recently updated first
+    book.save(update_fields=['updated_at', *sorted(dirty)])
     return book
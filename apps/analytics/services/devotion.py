@@ -5,12 +5,14 @@ Provides daily Bible verses and reflections based on the day of the year.
 No external API needed - uses a curated set of verses and reflections.
 """
 from datetime import date
-from typing import Dict, Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping, Optional
 
 
 # Curated daily devotions (366 for leap years)
 # Each entry: (verse_reference, verse_text, reflection)
-DEVOTIONS = [
+DEVOTIONS = (
     # Day 1 - January 1
     {
         'reference': 'Psalm 118:24',
@@ -81,10 +83,26 @@ DEVOTIONS = [
         'reflection': "God provides for His children. When you feel anxious about the future or lacking in the present, remember the Good Shepherd who leads, protects, and provides for all your needs.",
         'theme': 'Provision',
     },
-]
+)
 
 
-def get_daily_devotion(for_date: Optional[date] = None) -> Dict:
+@lru_cache(maxsize=366)
+def _devotion_for_day(day_of_year: int) -> Mapping:
+    """Build the (read-only) devotion for a day of the year; shared between calls."""
+    # Cycle through devotions (we have 10, so cycle them)
+    # In production, you'd have 365+ devotions
+    devotion = DEVOTIONS[(day_of_year - 1) % len(DEVOTIONS)]
+
+    return MappingProxyType({
+        'reference': devotion['reference'],
+        'verse': devotion['verse'],
+        'reflection': devotion['reflection'],
+        'theme': devotion['theme'],
+        'day_number': day_of_year,
+    })
+
+
+def get_daily_devotion(for_date: Optional[date] = None) -> Mapping:
     """
     Get the daily devotion for a given date.
 
@@ -92,7 +110,7 @@ def get_daily_devotion(for_date: Optional[date] = None) -> Dict:
         for_date: Date to get devotion for. Defaults to today.
 
     Returns:
-        dict: {
+        Read-only mapping: {
             'reference': Bible verse reference,
             'verse': The verse text,
             'reflection': Daily reflection,
@@ -104,23 +122,10 @@ def get_daily_devotion(for_date: Optional[date] = None) -> Dict:
         for_date = date.today()
 
     # Get day of year (1-366)
-    day_of_year = for_date.timetuple().tm_yday
-
-    # Cycle through devotions (we have 10, so cycle them)
-    # In production, you'd have 365+ devotions
-    devotion_index = (day_of_year - 1) % len(DEVOTIONS)
-    devotion = DEVOTIONS[devotion_index]
-
-    return {
-        'reference': devotion['reference'],
-        'verse': devotion['verse'],
-        'reflection': devotion['reflection'],
-        'theme': devotion['theme'],
-        'day_number': day_of_year,
-    }
+    return _devotion_for_day(for_date.timetuple().tm_yday)
 
 
-def get_devotion_for_entry(entry_date: date) -> Optional[Dict]:
+def get_devotion_for_entry(entry_date: date) -> Optional[Mapping]:
     """
     Get devotion for a specific journal entry date.
 
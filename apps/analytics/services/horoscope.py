@@ -4,7 +4,8 @@ Zodiac sign calculation service.
 Calculates zodiac sign from birthday. No external API needed.
 """
 from datetime import date
-from typing import Dict, Optional, Tuple
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
 
 
 # Zodiac signs with their date ranges (month, day)
@@ -97,6 +98,29 @@ ZODIAC_DATE_RANGES = {
 }
 
 
+def _sign_for_month_day(month: int, day: int) -> Optional[str]:
+    for sign, start_m, start_d, end_m, end_d in ZODIAC_SIGNS:
+        # Handle Capricorn which spans year boundary
+        if start_m > end_m:  # Dec-Jan
+            if (month == start_m and day >= start_d) or (month == end_m and day <= end_d):
+                return sign
+        else:
+            if (month == start_m and day >= start_d) or \
+               (month == end_m and day <= end_d) or \
+               (start_m < month < end_m):
+                return sign
+
+    return None
+
+
+# Sign for every calendar day, indexed by month * 32 + day (built once at import)
+_SIGN_BY_MONTH_DAY = tuple(
+    _sign_for_month_day(month, day) if 1 <= month <= 12 and 1 <= day <= 31 else None
+    for month in range(13)
+    for day in range(32)
+)
+
+
 def get_zodiac_sign(birthday: date) -> Optional[str]:
     """
     Calculate zodiac sign from birthday.
@@ -110,21 +134,7 @@ def get_zodiac_sign(birthday: date) -> Optional[str]:
     if not birthday:
         return None
 
-    month = birthday.month
-    day = birthday.day
-
-    for sign, start_m, start_d, end_m, end_d in ZODIAC_SIGNS:
-        # Handle Capricorn which spans year boundary
-        if start_m > end_m:  # Dec-Jan
-            if (month == start_m and day >= start_d) or (month == end_m and day <= end_d):
-                return sign
-        else:
-            if (month == start_m and day >= start_d) or \
-               (month == end_m and day <= end_d) or \
-               (start_m < month < end_m):
-                return sign
-
-    return None
+    return _SIGN_BY_MONTH_DAY[birthday.month * 32 + birthday.day]
 
 
 def get_zodiac_display_name(sign: str) -> str:
@@ -152,7 +162,21 @@ def get_zodiac_date_range(sign: str) -> str:
     return ZODIAC_DATE_RANGES.get(sign, '')
 
 
-def get_zodiac_data(birthday: date) -> Optional[Dict]:
+# Complete, read-only zodiac data per sign (built once at import)
+_ZODIAC_DATA = {
+    sign: MappingProxyType({
+        'sign': sign,
+        'display_name': get_zodiac_display_name(sign),
+        'symbol': get_zodiac_symbol(sign),
+        'element': get_zodiac_element(sign),
+        'element_color': get_element_color(get_zodiac_element(sign)),
+        'date_range': get_zodiac_date_range(sign),
+    })
+    for sign in ZODIAC_DISPLAY
+}
+
+
+def get_zodiac_data(birthday: date) -> Optional[Mapping]:
     """
     Get complete zodiac data for a birthday.
 
@@ -160,25 +184,22 @@ def get_zodiac_data(birthday: date) -> Optional[Dict]:
         birthday: Date of birth
 
     Returns:
-        Dict with sign, display_name, symbol, element, color, date_range
-        or None if birthday is None
+        Read-only mapping with sign, display_name, symbol, element, color,
+        date_range, or None if birthday is None
     """
     sign = get_zodiac_sign(birthday)
     if not sign:
         return None
 
-    element = get_zodiac_element(sign)
+    return _ZODIAC_DATA[sign]
 
-    return {
-        'sign': sign,
-        'display_name': get_zodiac_display_name(sign),
-        'symbol': get_zodiac_symbol(sign),
-        'element': element,
-        'element_color': get_element_color(element),
-        'date_range': get_zodiac_date_range(sign),
-    }
+
+# Signs grouped by element, in ZODIAC_ELEMENTS order
+_SIGNS_BY_ELEMENT = {}
+for _sign, _element in ZODIAC_ELEMENTS.items():
+    _SIGNS_BY_ELEMENT.setdefault(_element, []).append(_sign)
 
 
 def get_signs_by_element(element: str) -> list:
     """Get all signs for a given element."""
-    return [sign for sign, elem in ZODIAC_ELEMENTS.items() if elem == element]
+    return list(_SIGNS_BY_ELEMENT.get(element, ()))
@@ -6,73 +6,154 @@ Generates correlations between mood/sentiment and:
 - Weather conditions
 - Zodiac sign periods
 """
-from collections import defaultdict
+from bisect import bisect_right
+from collections import Counter, defaultdict
 from typing import Dict, List, Optional
-from django.db.models import Avg, Count
+from django.core.cache import cache
+from django.db.models import Avg, BooleanField, Case, Count, Sum, Value, When
 from django.contrib.auth.models import User
 
 from apps.analytics.services.moon import MOON_PHASE_DISPLAY, MOON_PHASE_ICONS
 from apps.analytics.services.horoscope import ZODIAC_DISPLAY, ZODIAC_SYMBOLS, ELEMENT_COLORS, get_zodiac_element
 from apps.analytics.services.weather import WEATHER_DISPLAY
 
+# Temperature ranges (in Fahrenheit), coldest first and contiguous
+# Each tuple: (key, min_temp, max_temp, label)
+TEMP_RANGES = (
+    ('cold', 0, 30, '<30°'),
+    ('cool', 30, 60, '30-59°'),
+    ('mild', 60, 80, '60-79°'),
+    ('warm', 80, 100, '80-99°'),
+    ('hot', 100, 200, '≥100°'),
+)
+
+# The same ranges in Celsius (the unit temperatures are stored in), so rows
+# are bucketed without converting each one: lower bound, then (key, upper bound)
+TEMP_RANGES_MIN_CELSIUS = (TEMP_RANGES[0][1] - 32) * 5 / 9
+TEMP_RANGE_BOUNDS_CELSIUS = tuple(
+    (key, (max_temp - 32) * 5 / 9) for key, min_temp, max_temp, label in TEMP_RANGES
+)
+
+# Correlations are keyed on the user's latest analysis, so this only bounds
+# staleness from bulk backfills that don't touch analyzed_at
+CORRELATIONS_CACHE_TIMEOUT = 3600
+
+# Display mood bands by average sentiment: a score at or above
+# SENTIMENT_BANDS[i] (and below the next bound) maps to SENTIMENT_BAND_MOODS[i + 1]
+SENTIMENT_BANDS = (-0.6, -0.4, -0.2, 0.2, 0.4, 0.6)
+SENTIMENT_BAND_MOODS = ('difficult', 'sad', 'reflective', 'neutral', 'upbeat', 'happy', 'ecstatic')
+
+
+def sentiment_display_mood(avg_sentiment: float) -> str:
+    """Map an average sentiment score to its display mood band."""
+    return SENTIMENT_BAND_MOODS[bisect_right(SENTIMENT_BANDS, avg_sentiment)]
+
+
+def _temp_range_case() -> Case:
+    """Case expression naming the TEMP_RANGES bucket of analysis.temperature ('' when outside all)."""
+    # The ranges are contiguous, so each bucket only needs its upper bound
+    return Case(
+        When(analysis__temperature__lt=TEMP_RANGES_MIN_CELSIUS, then=Value('')),
+        *[When(analysis__temperature__lt=bound, then=Value(key)) for key, bound in TEMP_RANGE_BOUNDS_CELSIUS],
+        default=Value(''),
+    )
+
 
-def generate_moon_correlation(user: User, days: int = 90) -> Dict:
+def _correlation_rows(user: User, days: int) -> List[Dict]:
     """
-    Correlate mood with moon phases over the specified period.
+    Grouped rows feeding all three correlations in a single query.
 
-    Returns aggregated sentiment and mood counts by moon phase.
+    One row per (in_period, moon phase, weather condition, temperature range,
+    mood) over all of the user's analyzed entries, with the entry count and
+    sentiment sum. in_period marks entries inside the last `days` days; the
+    zodiac insights use every row.
     """
     from apps.journal.models import Entry
-    from apps.analytics.models import EntryAnalysis
     from datetime import timedelta
     from django.utils import timezone
 
     start_date = timezone.now().date() - timedelta(days=days)
 
-    # Get entries with moon phase data
-    entries = Entry.objects.filter(
-        user=user,
-        entry_date__gte=start_date,
-        is_analyzed=True
-    ).select_related('analysis').exclude(
-        analysis__moon_phase=''
+    return list(
+        Entry.objects.filter(
+            user=user,
+            is_analyzed=True
+        ).annotate(
+            in_period=Case(
+                When(entry_date__gte=start_date, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ),
+            temp_range=_temp_range_case(),
+        ).values(
+            'in_period',
+            'analysis__moon_phase',
+            'analysis__weather_condition',
+            'temp_range',
+            'analysis__detected_mood',
+        ).annotate(
+            count=Count('id'),
+            total_sentiment=Sum('analysis__sentiment_score'),
+        ).order_by()
     )
 
+
+def generate_moon_correlation(user: User, days: int = 90, rows: Optional[List[Dict]] = None) -> Dict:
+    """
+    Correlate mood with moon phases over the specified period.
+
+    Returns aggregated sentiment and mood counts by moon phase. `rows` are
+    shared grouped rows from _correlation_rows; queried here when omitted.
+    """
+    from apps.journal.models import Entry
+    from datetime import timedelta
+    from django.utils import timezone
+
+    if rows is None:
+        start_date = timezone.now().date() - timedelta(days=days)
+
+        # Get entries with moon phase data
+        entries = Entry.objects.filter(
+            user=user,
+            entry_date__gte=start_date,
+            is_analyzed=True
+        ).exclude(
+            analysis__moon_phase=''
+        )
+
+        # Count and sum per (phase, mood) in the database, one row per group
+        rows = entries.values('analysis__moon_phase', 'analysis__detected_mood').annotate(
+            count=Count('id'),
+            total_sentiment=Sum('analysis__sentiment_score'),
+        ).order_by()
+
     # Aggregate by moon phase
-    phase_data = defaultdict(lambda: {
-        'count': 0,
-        'total_sentiment': 0.0,
-        'moods': defaultdict(int),
-    })
-
-    for entry in entries:
-        if not hasattr(entry, 'analysis'):
-            continue
+    phase_counts = Counter()
+    phase_sentiment = defaultdict(float)
+    phase_moods = defaultdict(Counter)
 
-        phase = entry.analysis.moon_phase
-        if not phase:
+    for row in rows:
+        phase = row['analysis__moon_phase']
+        if not phase or not row.get('in_period', True):
             continue
 
-        phase_data[phase]['count'] += 1
-        phase_data[phase]['total_sentiment'] += entry.analysis.sentiment_score
-        phase_data[phase]['moods'][entry.analysis.detected_mood] += 1
+        count = row['count']
+        phase_counts[phase] += count
+        phase_sentiment[phase] += row['total_sentiment']
+        phase_moods[phase][row['analysis__detected_mood']] += count
 
     # Calculate averages and format results
     results = []
-    for phase, data in phase_data.items():
-        if data['count'] == 0:
-            continue
-
-        avg_sentiment = data['total_sentiment'] / data['count']
+    for phase, total in phase_counts.items():
+        avg_sentiment = phase_sentiment[phase] / total
 
         # Get mood distribution
-        moods = data['moods']
-        dominant_mood = max(moods.items(), key=lambda x: x[1])[0] if moods else ''
+        moods = phase_moods[phase]
+        dominant_mood = moods.most_common(1)[0][0] if moods else ''
 
         # Calculate sentiment-aligned mood display based on actual sentiment score
         positive_moods = moods.get('ecstatic', 0) + moods.get('happy', 0)
         negative_moods = moods.get('sad', 0) + moods.get('angry', 0)
-        total = data['count']
 
         # Determine display mood based on sentiment score (not dominant mood count)
         # This ensures the label matches what the sentiment actually indicates
@@ -83,24 +164,10 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
             # Check for mixed moods (both positive and negative present significantly)
             has_mixed_moods = pos_pct > 0.25 and neg_pct > 0.25
 
-            if avg_sentiment >= 0.6:
-                display_mood = 'ecstatic'
-            elif avg_sentiment >= 0.4:
-                display_mood = 'happy'
-            elif avg_sentiment >= 0.2:
-                display_mood = 'upbeat'
-            elif avg_sentiment >= -0.2:
-                # Neutral range - check if it's mixed or truly neutral
-                if has_mixed_moods:
-                    display_mood = 'mixed'
-                else:
-                    display_mood = 'neutral'
-            elif avg_sentiment >= -0.4:
-                display_mood = 'reflective'
-            elif avg_sentiment >= -0.6:
-                display_mood = 'sad'
-            else:
-                display_mood = 'difficult'
+            display_mood = sentiment_display_mood(avg_sentiment)
+            # Neutral range - check if it's mixed or truly neutral
+            if display_mood == 'neutral' and has_mixed_moods:
+                display_mood = 'mixed'
         else:
             display_mood = dominant_mood
 
@@ -108,7 +175,7 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
             'phase': phase,
             'display_name': MOON_PHASE_DISPLAY.get(phase, phase.replace('_', ' ').title()),
             'icon': MOON_PHASE_ICONS.get(phase, 'bi-moon'),
-            'count': data['count'],
+            'count': total,
             'avg_sentiment': round(avg_sentiment, 3),
             'sentiment_label': 'positive' if avg_sentiment > 0.05 else ('negative' if avg_sentiment < -0.05 else 'neutral'),
             'dominant_mood': dominant_mood,
@@ -121,12 +188,29 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
     # Generate insights based on display_mood (sentiment-aligned)
     insights = []
 
+    # One pass over the phases for the full/new moon rows, waxing/waning sums and the total
+    full_moon_data = new_moon_data = None
+    waxing_sum = waning_sum = 0.0
+    waxing_count = waning_count = total_entries = 0
+    for r in results:
+        phase = r['phase']
+        if phase == 'full_moon':
+            full_moon_data = r
+        elif phase == 'new_moon':
+            new_moon_data = r
+        elif 'waxing' in phase:
+            waxing_sum += r['avg_sentiment']
+            waxing_count += 1
+        elif 'waning' in phase:
+            waning_sum += r['avg_sentiment']
+            waning_count += 1
+        total_entries += r['count']
+
     if results:
         best_phase = results[0]
         worst_phase = results[-1]
 
         # Full moon specific insights
-        full_moon_data = next((r for r in results if r['phase'] == 'full_moon'), None)
         if full_moon_data and full_moon_data['count'] >= 2:
             mood = full_moon_data['display_mood']
             sentiment = full_moon_data['avg_sentiment']
@@ -143,7 +227,6 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
                 insights.append(f"🌕 Full moon phases tend to bring more reflective, introspective writing")
 
         # New moon insights
-        new_moon_data = next((r for r in results if r['phase'] == 'new_moon'), None)
         if new_moon_data and new_moon_data['count'] >= 2:
             mood = new_moon_data['display_mood']
             sentiment = new_moon_data['avg_sentiment']
@@ -174,12 +257,9 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
                 )
 
         # Waxing vs Waning comparison
-        waxing_phases = [r for r in results if 'waxing' in r['phase']]
-        waning_phases = [r for r in results if 'waning' in r['phase']]
-
-        if waxing_phases and waning_phases:
-            waxing_avg = sum(p['avg_sentiment'] for p in waxing_phases) / len(waxing_phases)
-            waning_avg = sum(p['avg_sentiment'] for p in waning_phases) / len(waning_phases)
+        if waxing_count and waning_count:
+            waxing_avg = waxing_sum / waxing_count
+            waning_avg = waning_sum / waning_count
 
             if waxing_avg - waning_avg > 0.15:
                 insights.append(
@@ -194,95 +274,78 @@ def generate_moon_correlation(user: User, days: int = 90) -> Dict:
         'phases': results,
         'insights': insights,
         'period_days': days,
-        'total_entries': sum(r['count'] for r in results),
+        'total_entries': total_entries,
     }
 
 
-def generate_weather_correlation(user: User, days: int = 90) -> Dict:
+def generate_weather_correlation(user: User, days: int = 90, rows: Optional[List[Dict]] = None) -> Dict:
     """
     Correlate mood with weather conditions over the specified period.
 
     Returns aggregated sentiment by temperature range and weather condition.
+    `rows` are shared grouped rows from _correlation_rows; queried here when
+    omitted.
     """
     from apps.journal.models import Entry
     from datetime import timedelta
     from django.utils import timezone
 
-    start_date = timezone.now().date() - timedelta(days=days)
-
-    # Get entries with weather data
-    entries = Entry.objects.filter(
-        user=user,
-        entry_date__gte=start_date,
-        is_analyzed=True
-    ).select_related('analysis').exclude(
-        analysis__weather_condition=''
-    ).exclude(
-        analysis__temperature__isnull=True
-    )
-
-    # Define temperature ranges (in Fahrenheit)
-    temp_ranges = [
-        ('cold', 0, 30, '<30°'),
-        ('cool', 30, 60, '30-59°'),
-        ('mild', 60, 80, '60-79°'),
-        ('warm', 80, 100, '80-99°'),
-        ('hot', 100, 200, '≥100°'),
-    ]
+    if rows is None:
+        start_date = timezone.now().date() - timedelta(days=days)
+
+        # Get entries with weather data
+        entries = Entry.objects.filter(
+            user=user,
+            entry_date__gte=start_date,
+            is_analyzed=True
+        ).exclude(
+            analysis__weather_condition=''
+        ).exclude(
+            analysis__temperature__isnull=True
+        )
+
+        # Bucket temperatures (stored in Celsius) into the Fahrenheit ranges and
+        # count/sum per (range, condition, mood) in the database
+        rows = entries.annotate(
+            temp_range=_temp_range_case(),
+        ).values('temp_range', 'analysis__weather_condition', 'analysis__detected_mood').annotate(
+            count=Count('id'),
+            total_sentiment=Sum('analysis__sentiment_score'),
+        ).order_by()
 
     # Aggregate by temperature range and weather condition
-    weather_temp_data = defaultdict(lambda: {
-        'count': 0,
-        'total_sentiment': 0.0,
-        'moods': defaultdict(int),
-        'conditions': defaultdict(int),
-    })
-
-    for entry in entries:
-        if not hasattr(entry, 'analysis'):
-            continue
+    range_counts = Counter()
+    range_sentiment = defaultdict(float)
+    range_moods = defaultdict(Counter)
+    range_conditions = defaultdict(Counter)
 
-        condition = entry.analysis.weather_condition
-        temp_celsius = entry.analysis.temperature
+    for row in rows:
+        temp_range_key = row['temp_range']
+        condition = row['analysis__weather_condition']
 
-        if not condition or temp_celsius is None:
+        if not temp_range_key or not condition or not row.get('in_period', True):
             continue
 
-        # Convert Celsius to Fahrenheit
-        temp = (temp_celsius * 9/5) + 32
-
-        # Determine temperature range
-        temp_range_key = None
-        for key, min_temp, max_temp, label in temp_ranges:
-            if min_temp <= temp < max_temp:
-                temp_range_key = key
-                break
-
-        if not temp_range_key:
-            continue
-
-        weather_temp_data[temp_range_key]['count'] += 1
-        weather_temp_data[temp_range_key]['total_sentiment'] += entry.analysis.sentiment_score
-        weather_temp_data[temp_range_key]['moods'][entry.analysis.detected_mood] += 1
-        weather_temp_data[temp_range_key]['conditions'][condition] += 1
+        count = row['count']
+        range_counts[temp_range_key] += count
+        range_sentiment[temp_range_key] += row['total_sentiment']
+        range_moods[temp_range_key][row['analysis__detected_mood']] += count
+        range_conditions[temp_range_key][condition] += count
 
     # Format results by temperature range
     temp_range_results = []
-    for range_key, min_temp, max_temp, label in temp_ranges:
-        if range_key not in weather_temp_data:
+    for range_key, min_temp, max_temp, label in TEMP_RANGES:
+        total = range_counts[range_key]
+        if not total:
             continue
 
-        data = weather_temp_data[range_key]
-        if data['count'] == 0:
-            continue
-
-        avg_sentiment = data['total_sentiment'] / data['count']
-        dominant_mood = max(data['moods'].items(), key=lambda x: x[1])[0] if data['moods'] else ''
+        avg_sentiment = range_sentiment[range_key] / total
+        moods = range_moods[range_key]
+        dominant_mood = moods.most_common(1)[0][0] if moods else ''
 
         # Get ALL conditions for this temperature range (sorted by frequency)
         condition_breakdown = []
-        sorted_conditions = sorted(data['conditions'].items(), key=lambda x: x[1], reverse=True)
-        for condition, count in sorted_conditions:
+        for condition, count in range_conditions[range_key].most_common():
             condition_breakdown.append({
                 'condition': condition,
                 'display_name': WEATHER_DISPLAY.get(condition, condition.title()),
@@ -295,15 +358,14 @@ def generate_weather_correlation(user: User, days: int = 90) -> Dict:
             'range_label': label,
             'min_temp': min_temp,
             'max_temp': max_temp,
-            'count': data['count'],
+            'count': total,
             'avg_sentiment': round(avg_sentiment, 3),
             'sentiment_label': 'positive' if avg_sentiment > 0.05 else ('negative' if avg_sentiment < -0.05 else 'neutral'),
             'dominant_mood': dominant_mood,
             'conditions': condition_breakdown,
         })
 
-    # Sort by temperature range (coldest to hottest)
-    temp_range_results.sort(key=lambda x: x['min_temp'])
+    # temp_range_results is already ordered coldest to hottest, following TEMP_RANGES
 
     # Generate insights
     insights = []
@@ -334,14 +396,14 @@ def generate_weather_correlation(user: User, days: int = 90) -> Dict:
     }
 
 
-def generate_zodiac_insights(user: User) -> Optional[Dict]:
+def generate_zodiac_insights(user: User, rows: Optional[List[Dict]] = None) -> Optional[Dict]:
     """
     Generate zodiac-based patterns for the user.
 
-    Only returns data if user has horoscope enabled.
+    Only returns data if user has horoscope enabled. `rows` are shared
+    grouped rows from _correlation_rows; queried here when omitted.
     """
     from apps.journal.models import Entry
-    from django.utils import timezone
 
     profile = user.profile
     if not profile.horoscope_enabled or not profile.birthday:
@@ -351,26 +413,37 @@ def generate_zodiac_insights(user: User) -> Optional[Dict]:
     if not zodiac_sign:
         return None
 
-    # Get all analyzed entries for this user
-    entries = Entry.objects.filter(
-        user=user,
-        is_analyzed=True
-    ).select_related('analysis')
-
-    if not entries.exists():
+    if rows is None:
+        # Get all analyzed entries for this user, counted and summed per mood
+        # (mood is None for entries without an analysis row)
+        rows = Entry.objects.filter(
+            user=user,
+            is_analyzed=True
+        ).values('analysis__detected_mood').annotate(
+            count=Count('id'),
+            total_sentiment=Sum('analysis__sentiment_score'),
+        ).order_by()
+
+    # Overall stats and mood distribution
+    total_entries = 0
+    analyzed = 0
+    total_sentiment = 0.0
+    moods = Counter()
+    for row in rows:
+        count = row['count']
+        total_entries += count
+        mood = row['analysis__detected_mood']
+        if mood is not None:
+            analyzed += count
+            total_sentiment += row['total_sentiment']
+            moods[mood] += count
+
+    if not total_entries:
         return None
 
-    # Calculate overall stats
-    sentiments = [e.analysis.sentiment_score for e in entries if hasattr(e, 'analysis')]
-    avg_sentiment = sum(sentiments) / len(sentiments) if sentiments else 0
+    avg_sentiment = total_sentiment / analyzed if analyzed else 0
 
-    # Get mood distribution
-    moods = defaultdict(int)
-    for entry in entries:
-        if hasattr(entry, 'analysis'):
-            moods[entry.analysis.detected_mood] += 1
-
-    dominant_mood = max(moods.items(), key=lambda x: x[1])[0] if moods else ''
+    dominant_mood = moods.most_common(1)[0][0] if moods else ''
 
     element = get_zodiac_element(zodiac_sign)
 
@@ -399,25 +472,54 @@ def generate_zodiac_insights(user: User) -> Optional[Dict]:
         'element_color': ELEMENT_COLORS.get(element, '#6b7280'),
         'avg_sentiment': round(avg_sentiment, 3),
         'dominant_mood': dominant_mood,
-        'total_entries': len(entries),
+        'total_entries': total_entries,
         'insights': insights,
     }
 
 
+# Bootstrap icon classes by (lowercase) weather condition
+WEATHER_ICONS = {
+    'clear': 'bi-sun',
+    'clouds': 'bi-cloud',
+    'rain': 'bi-cloud-rain',
+    'drizzle': 'bi-cloud-drizzle',
+    'thunderstorm': 'bi-cloud-lightning-rain',
+    'snow': 'bi-cloud-snow',
+    'mist': 'bi-cloud-haze',
+    'fog': 'bi-cloud-fog',
+    'haze': 'bi-cloud-haze',
+}
+
+
 def get_weather_icon(condition: str) -> str:
     """Get Bootstrap icon class for a weather condition."""
-    icons = {
-        'clear': 'bi-sun',
-        'clouds': 'bi-cloud',
-        'rain': 'bi-cloud-rain',
-        'drizzle': 'bi-cloud-drizzle',
-        'thunderstorm': 'bi-cloud-lightning-rain',
-        'snow': 'bi-cloud-snow',
-        'mist': 'bi-cloud-haze',
-        'fog': 'bi-cloud-fog',
-        'haze': 'bi-cloud-haze',
-    }
-    return icons.get(condition.lower(), 'bi-cloud')
+    # Stored conditions are already lowercase; only normalize on a miss
+    icon = WEATHER_ICONS.get(condition)
+    if icon is not None:
+        return icon
+    return WEATHER_ICONS.get(condition.lower(), 'bi-cloud')
+
+
+def _correlations_cache_key(user: User, days: int) -> str:
+    """
+    Cache key for a user's correlations.
+
+    Built from the count and latest analyzed_at of their analyses, so adding,
+    re-analyzing or deleting an entry moves to a new key, plus today's date
+    (the period window) and the zodiac sign the profile currently shows.
+    """
+    from apps.analytics.models import EntryAnalysis
+    from django.db.models import Max
+    from django.utils import timezone
+
+    stats = EntryAnalysis.objects.filter(entry__user=user).aggregate(
+        count=Count('id'),
+        latest=Max('analyzed_at'),
+    )
+    latest = stats['latest'].timestamp() if stats['latest'] else 0
+    profile = user.profile
+    sign = (profile.zodiac_sign or '') if profile.horoscope_enabled else ''
+    return f"correlations:{user.id}:{days}:{timezone.now().date()}:{stats['count']}:{latest}:{sign}"
 
 
 def generate_all_correlations(user: User, days: int = 90) -> Dict:
@@ -425,9 +527,17 @@ def generate_all_correlations(user: User, days: int = 90) -> Dict:
     Generate all correlation insights for a user.
 
     Convenience function to get moon, weather, and zodiac insights at once.
+    Cached until one of the user's analyses changes (see _correlations_cache_key).
     """
-    return {
-        'moon': generate_moon_correlation(user, days),
-        'weather': generate_weather_correlation(user, days),
-        'zodiac': generate_zodiac_insights(user),
-    }
+    cache_key = _correlations_cache_key(user, days)
+    correlations = cache.get(cache_key)
+    if correlations is None:
+        # One grouped query shared by all three
+        rows = _correlation_rows(user, days)
+        correlations = {
+            'moon': generate_moon_correlation(user, days, rows),
+            'weather': generate_weather_correlation(user, days, rows),
+            'zodiac': generate_zodiac_insights(user, rows),
+        }
+        cache.set(cache_key, correlations, CORRELATIONS_CACHE_TIMEOUT)
+    return correlations
@@ -56,6 +56,14 @@ MOOD_KEYWORDS = {
 }
 
 
+# Derived once at import instead of on every classification
+_WORD_RE = re.compile(r'\b\w+\b')
+_MOOD_PHRASES = {
+    mood: [keyword for keyword in data['keywords'] if ' ' in keyword]
+    for mood, data in MOOD_KEYWORDS.items()
+}
+
+
 def count_mood_keywords(text: str) -> dict:
     """
     Count keywords for each mood category in text.
@@ -64,14 +72,14 @@ def count_mood_keywords(text: str) -> dict:
         dict: {mood: count} for each mood
     """
     text_lower = text.lower()
-    words = set(re.findall(r'\b\w+\b', text_lower))
+    words = set(_WORD_RE.findall(text_lower))
 
     counts = {}
     for mood, data in MOOD_KEYWORDS.items():
         count = len(words.intersection(data['keywords']))
         # Also check for multi-word phrases
-        for phrase in data['keywords']:
-            if ' ' in phrase and phrase in text_lower:
+        for phrase in _MOOD_PHRASES[mood]:
+            if phrase in text_lower:
                 count += 2  # Weight phrases higher
         counts[mood] = count
 
@@ -97,7 +97,7 @@ def find_matching_person(user, name):
     return None, best_score
 
 
-def get_or_create_tracked_person(user, capture):
+def get_or_create_tracked_person(user, capture, person=None):
     """
     Get or create a TrackedPerson from an EntryCapture.
 
@@ -106,6 +106,8 @@ def get_or_create_tracked_person(user, capture):
     Args:
         user: The user who owns the capture
         capture: An EntryCapture with capture_type='person'
+        person: Optional TrackedPerson the caller already matched this
+            capture to; skips the lookup
 
     Returns:
         TrackedPerson or None if capture has no name
@@ -119,20 +121,21 @@ def get_or_create_tracked_person(user, capture):
         logger.warning(f"Person capture {capture.id} has no name")
         return None
 
-    # Find or create the person
-    existing, confidence = find_matching_person(user, name)
-
-    if existing:
-        person = existing
-        logger.info(f"Matched person capture to existing: {person.name} (confidence: {confidence}%)")
-    else:
-        # Create new person
-        person = TrackedPerson.objects.create(
-            user=user,
-            name=name,
-            normalized_name=normalize_name(name),
-        )
-        logger.info(f"Created new TrackedPerson: {person.name}")
+    # Find or create the person, unless the caller already resolved it
+    if person is None:
+        existing, confidence = find_matching_person(user, name)
+
+        if existing:
+            person = existing
+            logger.info(f"Matched person capture to existing: {person.name} (confidence: {confidence}%)")
+        else:
+            # Create new person
+            person = TrackedPerson.objects.create(
+                user=user,
+                name=name,
+                normalized_name=normalize_name(name),
+            )
+            logger.info(f"Created new TrackedPerson: {person.name}")
 
     # Link this capture
     person.captures.add(capture)
@@ -20,6 +20,24 @@ OWM_GEOCODING_URL = 'https://api.openweathermap.org/geo/1.0/direct'
 # Open-Meteo API base URL (free, no API key needed)
 OPEN_METEO_URL = 'https://archive-api.open-meteo.com/v1/archive'
 
+
+class WeatherRateLimited(Exception):
+    """A weather API answered 429; retry_after is its Retry-After in seconds, if given."""
+
+    def __init__(self, api, retry_after=None):
+        super().__init__(f"{api} rate limit exceeded")
+        self.retry_after = retry_after
+
+
+def _rate_limited(api, response):
+    """Build WeatherRateLimited from a 429 response."""
+    try:
+        retry_after = float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        retry_after = None
+    return WeatherRateLimited(api, retry_after)
+
+
 # Weather condition to Bootstrap icon mapping
 WEATHER_ICONS = {
     'clear': 'bi-sun',
@@ -248,13 +266,15 @@ WMO_WEATHER_CODES = {
 }
 
 
-def get_city_coordinates(city: str, country_code: str = 'US') -> Optional[Dict]:
+def get_city_coordinates(city: str, country_code: str = 'US', *,
+                         raise_on_rate_limit: bool = False) -> Optional[Dict]:
     """
     Get latitude and longitude for a city using OpenWeatherMap Geocoding API.
 
     Args:
         city: City name
         country_code: Two-letter country code
+        raise_on_rate_limit: Raise WeatherRateLimited on a 429 instead of returning None
 
     Returns:
         Dict with 'lat' and 'lon' or None if not found
@@ -291,10 +311,14 @@ def get_city_coordinates(city: str, country_code: str = 'US') -> Optional[Dict]:
             else:
                 logger.warning(f"City not found: {location}")
                 return None
+        elif response.status_code == 429 and raise_on_rate_limit:
+            raise _rate_limited('Geocoding API', response)
         else:
             logger.error(f"Geocoding API error: {response.status_code}")
             return None
 
+    except WeatherRateLimited:
+        raise
     except requests.exceptions.Timeout:
         logger.error("Geocoding API timeout")
         return None
@@ -306,7 +330,9 @@ def get_city_coordinates(city: str, country_code: str = 'US') -> Optional[Dict]:
         return None
 
 
-def get_historical_weather(city: str, entry_date: date, country_code: str = 'US') -> Optional[Dict]:
+def get_historical_weather(city: str, entry_date: date, country_code: str = 'US', *,
+                           coords: Optional[Dict] = None,
+                           raise_on_rate_limit: bool = False) -> Optional[Dict]:
     """
     Fetch historical weather data for a specific date using Open-Meteo API.
 
@@ -314,6 +340,8 @@ def get_historical_weather(city: str, entry_date: date, country_code: str = 'US'
         city: City name
         entry_date: Date to fetch weather for (date object or datetime)
         country_code: Two-letter country code
+        coords: Result of get_city_coordinates() for the city, to skip geocoding
+        raise_on_rate_limit: Raise WeatherRateLimited on a 429 instead of returning None
 
     Returns:
         Dict with weather data or None if unavailable
@@ -323,7 +351,8 @@ def get_historical_weather(city: str, entry_date: date, country_code: str = 'US'
         entry_date = entry_date.date()
 
     # Get coordinates for the city
-    coords = get_city_coordinates(city, country_code)
+    if coords is None:
+        coords = get_city_coordinates(city, country_code, raise_on_rate_limit=raise_on_rate_limit)
     if not coords:
         logger.warning(f"Could not get coordinates for {city}")
         return None
@@ -346,10 +375,14 @@ def get_historical_weather(city: str, entry_date: date, country_code: str = 'US'
         if response.status_code == 200:
             data = response.json()
             return parse_open_meteo_response(data, city, country_code)
+        elif response.status_code == 429 and raise_on_rate_limit:
+            raise _rate_limited('Open-Meteo API', response)
         else:
             logger.error(f"Open-Meteo API error: {response.status_code}")
             return None
 
+    except WeatherRateLimited:
+        raise
     except requests.exceptions.Timeout:
         logger.error("Open-Meteo API timeout")
         return None
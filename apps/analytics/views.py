@@ -913,6 +913,7 @@ def book_detail(request, pk):
 def book_update(request, pk):
     """Update book details."""
     from .models import TrackedBook
+    from apps.analytics.services.book_matching import forget_book_index
     import json
     from datetime import date
 
@@ -950,6 +951,8 @@ def book_update(request, pk):
         book.finished_date = data['finished_date'] if data['finished_date'] else None
 
     book.save()
+    if 'title' in data or 'author' in data:
+        forget_book_index(request.user.id)
 
     return JsonResponse({
         'success': True,
@@ -969,6 +972,7 @@ def book_update(request, pk):
 def book_delete(request, pk):
     """Delete a tracked book."""
     from .models import TrackedBook
+    from apps.analytics.services.book_matching import forget_book_index
 
     try:
         book = TrackedBook.objects.get(pk=pk, user=request.user)
@@ -976,6 +980,7 @@ def book_delete(request, pk):
         return JsonResponse({'error': 'Book not found'}, status=404)
 
     book.delete()
+    forget_book_index(request.user.id)
     return JsonResponse({'success': True})
 
 
@@ -1,5 +1,5 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
 from django.db import transaction
 from .models import Entry, EntryCapture
@@ -281,6 +281,23 @@ def trigger_capture_processing(sender, instance, created, **kwargs):
             logger.error(f"Sync capture processing failed: {sync_error}")
 
 
+@receiver(pre_delete, sender=EntryCapture)
+def release_tracked_book_capture(sender, instance, **kwargs):
+    """
+    Keep TrackedBook.capture_count in step when a book capture is deleted.
+
+    Runs for direct deletes and for captures cascaded with their entry,
+    while the book/capture link still exists.
+    """
+    if instance.capture_type != 'book':
+        return
+
+    from django.db.models import F
+    from apps.analytics.models import TrackedBook
+
+    TrackedBook.objects.filter(captures=instance).update(capture_count=F('capture_count') - 1)
+
+
 @receiver(post_save, sender=Entry)
 def trigger_pov_processing(sender, instance, created, **kwargs):
     """
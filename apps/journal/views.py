@@ -2416,6 +2416,7 @@ def books_search(request):
 def books_create(request):
     """Create a new book for /book quick picker."""
     from apps.analytics.models import TrackedBook
+    from apps.analytics.services.book_matching import forget_book_index
 
     try:
         data = json.loads(request.body)
@@ -2446,6 +2447,7 @@ def books_create(request):
         normalized_title=title.lower(),
         status='reading'
     )
+    forget_book_index(request.user.id)
 
     return JsonResponse({
         'id': book.id,
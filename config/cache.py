@@ -0,0 +1,47 @@
+"""
+Redis cache backend that degrades instead of failing requests.
+
+Sessions (cached_db) and the app's memoized lookups all go through the
+default cache. When Redis is unreachable, reads behave as misses and writes
+are skipped, so requests fall back to the database instead of erroring.
+"""
+import logging
+from functools import wraps
+
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+
+def _fail_safe(default):
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except RedisError as e:
+                logger.warning(f"Cache {method.__name__} failed, continuing without cache: {e}")
+                return default(*args, **kwargs) if callable(default) else default
+        return wrapper
+    return decorator
+
+
+def _get_default(key, default=None, *args, **kwargs):
+    return default
+
+
+class FailSafeRedisCache(RedisCache):
+    """RedisCache whose operations log and fall back when Redis is down."""
+
+    get = _fail_safe(_get_default)(RedisCache.get)
+    get_many = _fail_safe({})(RedisCache.get_many)
+    has_key = _fail_safe(False)(RedisCache.has_key)
+    set = _fail_safe(None)(RedisCache.set)
+    set_many = _fail_safe([])(RedisCache.set_many)
+    touch = _fail_safe(False)(RedisCache.touch)
+    delete = _fail_safe(False)(RedisCache.delete)
+    delete_many = _fail_safe(None)(RedisCache.delete_many)
+    # Callers use add() to claim "first one wins" keys (e.g. Stripe event
+    # dedup); without Redis, let the caller proceed rather than drop work
+    add = _fail_safe(True)(RedisCache.add)
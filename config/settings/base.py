@@ -98,8 +98,14 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are cached per process (web and Celery workers)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -209,6 +215,36 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+# Ack after the task finishes and skip tasks already recorded as successful,
+# so a broker redelivery doesn't send the same email twice
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_DEDUPLICATE_SUCCESSFUL_TASKS = True
+# Admin notifications go to their own low-priority queue; Stripe webhook
+# events get a dedicated queue so they aren't stuck behind email jobs
+CELERY_TASK_ROUTES = {
+    'apps.accounts.tasks.send_admin_*': {'queue': 'admin_notifications'},
+    'apps.accounts.tasks.process_stripe_event': {'queue': 'stripe'},
+}
+
+# Cache (Redis, shared with Celery). Errors degrade to cache misses (see
+# config/cache.py), and short socket timeouts keep an outage from stalling requests
+CACHES = {
+    'default': {
+        'BACKEND': 'config.cache.FailSafeRedisCache',
+        'LOCATION': env('REDIS_URL', default='redis://localhost:6379/0'),
+        'KEY_PREFIX': 'reflekt',
+        'OPTIONS': {
+            'socket_connect_timeout': 1,
+            'socket_timeout': 1,
+        },
+    }
+}
+
+# Sessions are read from the cache and written through to the database,
+# so most requests never touch the django_session table. If Redis is down,
+# session reads fall through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'default'
 
 # Email configuration
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'  # Override in production